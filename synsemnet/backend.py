@@ -1,8 +1,19 @@
 import re
+import numpy as np
 import tensorflow as tf
 
 
 parse_initializer = re.compile('(.*_initializer)(_(.*))?')
+parse_rnn_variable = re.compile('(.*/)?([^/]*_(fwd|bwd)_l[0-9]+)/(.*/)?(kernel|recurrent_kernel|bias)$')
+
+RNN_IMPLS = ['keras', 'fused']
+LSTM_GATE_ORDER = {
+    'keras': 'ifco',
+    'fused': 'icfo'
+}
+# Constant offset added to the forget gate of fused LSTMs, so that they start with the same forget bias of 1
+# as Keras LSTMs (unit_forget_bias=True). Keras layers store it in the bias, fused layers do not.
+LSTM_FUSED_FORGET_BIAS = 1.
 
 
 def get_session(session):
@@ -187,21 +198,133 @@ def make_lambda(layer, session=None, use_kwargs=False):
             return apply_layer
 
 
-def make_bi_rnn_layer(fwd, bwd, session=None):
+def get_sequence_lengths(x, mask=None):
+    if mask is None:
+        return tf.fill([tf.shape(x)[0]], tf.shape(x)[1])
+    return tf.cast(tf.round(tf.reduce_sum(mask, axis=1)), dtype=tf.int32)
+
+
+def pre_to_post_padding(x, lengths):
+    # [0, 0, a, b, c] -> [a, b, c, 0, 0]
+    return tf.reverse_sequence(tf.reverse(x, axis=[1]), lengths, seq_axis=1, batch_axis=0)
+
+
+def post_to_pre_padding(x, lengths):
+    # [a, b, c, 0, 0] -> [0, 0, a, b, c]
+    return tf.reverse(tf.reverse_sequence(x, lengths, seq_axis=1, batch_axis=0), axis=[1])
+
+
+def reverse_padded_sequence(x, lengths):
+    # Reverse the unpadded elements of 'pre'-padded sequences in place: [0, 0, a, b, c] -> [0, 0, c, b, a]
+    return tf.reverse(pre_to_post_padding(x, lengths), axis=[1])
+
+
+def make_bi_rnn_layer(fwd, bwd, length_aware=False, session=None):
     session = get_session(session)
     with session.as_default():
         with session.graph.as_default():
-            def bi_rnn(x, fwd=fwd, bwd=bwd, mask=None):
-                f = fwd(x, mask=mask)
-                if mask is not None:
-                    mask = tf.reverse(mask, axis=[1])
-                b = bwd(tf.reverse(x, axis=[1]), mask=mask)
-                out = tf.concat([f, b], axis=-1)
-                return out
+            if length_aware:
+                def bi_rnn(x, fwd=fwd, bwd=bwd, mask=None):
+                    lengths = get_sequence_lengths(x, mask=mask)
+                    f = fwd(x, mask=mask)
+                    b = bwd(reverse_padded_sequence(x, lengths), mask=mask)
+                    if len(b.shape) == 3:
+                        b = reverse_padded_sequence(b, lengths)
+                    out = tf.concat([f, b], axis=-1)
+                    return out
+            else:
+                def bi_rnn(x, fwd=fwd, bwd=bwd, mask=None):
+                    f = fwd(x, mask=mask)
+                    if mask is not None:
+                        mask = tf.reverse(mask, axis=[1])
+                    b = bwd(tf.reverse(x, axis=[1]), mask=mask)
+                    out = tf.concat([f, b], axis=-1)
+                    return out
 
             return bi_rnn
 
 
+def reorder_lstm_gates(x, src_order, tgt_order):
+    gates = np.split(x, 4, axis=-1)
+    return np.concatenate([gates[src_order.index(g)] for g in tgt_order], axis=-1)
+
+
+def convert_lstm_weights(weights, tgt_impl):
+    """
+    Convert the weights of one LSTM layer between RNN implementations.
+
+    :param weights: ``dict``; map from parameter name (``'kernel'``, ``'recurrent_kernel'``, ``'bias'``) to ``numpy`` array, in either layout. Keras layers store separate input and recurrent kernels; fused layers store a single kernel over the concatenation of inputs and previous outputs, and a bias without the constant forget bias offset ``LSTM_FUSED_FORGET_BIAS``.
+    :param tgt_impl: ``str``; target implementation, one of ``['keras', 'fused']``.
+    :return: ``dict``; map from parameter name to ``numpy`` array in the layout of **tgt_impl**.
+    """
+    assert tgt_impl in RNN_IMPLS, 'Unrecognized RNN implementation "%s".' % tgt_impl
+    src_impl = 'keras' if 'recurrent_kernel' in weights else 'fused'
+
+    kernel = weights['kernel']
+    bias = weights['bias']
+    units = bias.shape[-1] // 4
+    if src_impl == 'keras':
+        kernel = np.concatenate([kernel, weights['recurrent_kernel']], axis=0)
+
+    kernel = reorder_lstm_gates(kernel, LSTM_GATE_ORDER[src_impl], LSTM_GATE_ORDER[tgt_impl])
+    bias = reorder_lstm_gates(bias, LSTM_GATE_ORDER[src_impl], LSTM_GATE_ORDER[tgt_impl])
+    if src_impl != tgt_impl:
+        f = LSTM_GATE_ORDER[tgt_impl].index('f')
+        bias = bias.copy()
+        if tgt_impl == 'keras':
+            bias[..., f * units:(f + 1) * units] += LSTM_FUSED_FORGET_BIAS
+        else:
+            bias[..., f * units:(f + 1) * units] -= LSTM_FUSED_FORGET_BIAS
+
+    if tgt_impl == 'keras':
+        return {
+            'kernel': kernel[:-units],
+            'recurrent_kernel': kernel[-units:],
+            'bias': bias
+        }
+
+    return {
+        'kernel': kernel,
+        'bias': bias
+    }
+
+
+def get_rnn_weights(values):
+    """
+    Group RNN layer parameters by layer name.
+
+    :param values: ``dict``; map from variable name to value (e.g. a ``numpy`` array or a ``tf.Variable``).
+    :return: ``dict``; map from RNN layer name to map from parameter name to value.
+    """
+    out = {}
+    for name in values:
+        match = parse_rnn_variable.match(name.split(':')[0])
+        if match:
+            layer_name = match.group(2)
+            param_name = match.group(5)
+            if layer_name not in out:
+                out[layer_name] = {}
+            out[layer_name][param_name] = values[name]
+
+    return out
+
+
+def rnn_layer_is_length_aware(layer_name, params):
+    """
+    Check whether saved or model variables of an RNN layer belong to a length-aware layer, i.e. one whose backward
+    outputs are re-aligned with their input positions (see ``RNNLayer``).
+
+    :param layer_name: ``str``; name of the RNN layer.
+    :param params: ``dict``; map from parameter name to variable name.
+    :return: ``bool``; whether the layer is length-aware.
+    """
+    # Fused layers are always length-aware. Length-aware Keras cells run inside tf.nn.dynamic_rnn, which scopes
+    # their variables under 'rnn/', while the mask-based Keras LSTM layer does not.
+    if 'recurrent_kernel' not in params:
+        return True
+    return any([('/' + params[x]).find('/rnn/%s/' % layer_name) >= 0 for x in params])
+
+
 def replace_gradient(fw_op, bw_op, session=None):
     session = get_session(session)
     with session.as_default():
@@ -485,11 +608,17 @@ class RNNLayer(object):
             refeed_outputs=False,
             return_sequences=True,
             batch_normalization_decay=None,
+            length_aware=False,
+            rnn_impl='keras',
             name=None,
             session=None
     ):
         self.session = get_session(session)
 
+        assert rnn_impl in RNN_IMPLS, 'Unrecognized RNN implementation "%s".' % rnn_impl
+        if rnn_impl == 'fused' and (activation != 'tanh' or recurrent_activation != 'sigmoid'):
+            raise ValueError('The fused RNN implementation only supports tanh activations and sigmoid recurrent activations.')
+
         self.training = training
         self.units = units
         self.activation = get_activation(activation, session=self.session, training=self.training)
@@ -499,6 +628,9 @@ class RNNLayer(object):
         self.refeed_outputs = refeed_outputs
         self.return_sequences = return_sequences
         self.batch_normalization_decay = batch_normalization_decay
+        self.rnn_impl = rnn_impl
+        # The fused kernel always runs on per-sequence lengths
+        self.length_aware = length_aware or rnn_impl == 'fused'
         self.name = name
 
         self.rnn_layer = None
@@ -516,16 +648,70 @@ class RNNLayer(object):
                     else:
                         output_dim = inputs.shape[-1]
 
-                    self.rnn_layer = RNN(
-                        output_dim,
-                        return_sequences=self.return_sequences,
-                        activation=self.activation,
-                        recurrent_activation=self.recurrent_activation,
-                        name=self.name
-                    )
+                    if self.rnn_impl == 'fused':
+                        # Same gates as the Keras LSTM (no peepholes, no cell clipping), computed in one op per
+                        # sequence rather than a few ops per timestep. The fused bias starts at zero, so the forget
+                        # bias of the Keras LSTM is added as a constant offset (see convert_lstm_weights).
+                        self.rnn_layer = tf.contrib.rnn.LSTMBlockFusedCell(
+                            output_dim,
+                            forget_bias=LSTM_FUSED_FORGET_BIAS,
+                            name=self.name
+                        )
+                    elif self.length_aware:
+                        self.rnn_layer = tf.keras.layers.LSTMCell(
+                            output_dim,
+                            activation=self.activation,
+                            recurrent_activation=self.recurrent_activation,
+                            name=self.name
+                        )
+                    else:
+                        self.rnn_layer = RNN(
+                            output_dim,
+                            return_sequences=self.return_sequences,
+                            activation=self.activation,
+                            recurrent_activation=self.recurrent_activation,
+                            name=self.name
+                        )
 
             self.built = True
 
+    def _call_length_aware(self, inputs, mask=None):
+        # Inputs are 'pre'-padded. Drop the leading timesteps that are padding in every row, left-align the
+        # rest, and run with per-row sequence lengths so that no row computes past its own length.
+        lengths = get_sequence_lengths(inputs, mask=mask)
+        T = tf.shape(inputs)[1]
+        T_max = tf.reduce_max(lengths)
+        n_pad = T - T_max
+
+        X = pre_to_post_padding(inputs[:, n_pad:], lengths)
+        if self.rnn_impl == 'fused':
+            # The fused kernel is time-major and reads the final state at position length - 1,
+            # so empty rows (e.g. padding words) run one step and are zeroed afterward.
+            nonempty = tf.cast(lengths > 0, dtype=inputs.dtype)
+            H, (_, h) = self.rnn_layer(
+                tf.transpose(X, [1, 0, 2]),
+                sequence_length=tf.maximum(lengths, 1),
+                dtype=inputs.dtype
+            )
+            H = tf.transpose(H, [1, 0, 2]) * nonempty[:, None, None]
+            h = h * nonempty[:, None]
+        else:
+            H, state = tf.nn.dynamic_rnn(
+                self.rnn_layer,
+                X,
+                sequence_length=lengths,
+                dtype=inputs.dtype
+            )
+            h = state[0]
+
+        if self.return_sequences:
+            H = post_to_pre_padding(H, lengths)
+            H = tf.pad(H, [[0, 0], [n_pad, 0], [0, 0]])
+        else:
+            H = h
+
+        return H
+
     def __call__(self, inputs, mask=None):
         if not self.built:
             self.build(inputs)
@@ -533,7 +719,10 @@ class RNNLayer(object):
         with self.session.as_default():
             with self.session.graph.as_default():
 
-                H = self.rnn_layer(inputs, mask=mask)
+                if self.length_aware:
+                    H = self._call_length_aware(inputs, mask=mask)
+                else:
+                    H = self.rnn_layer(inputs, mask=mask)
                 if self.batch_normalization_decay:
                     H = tf.contrib.layers.batch_norm(
                         H,
@@ -548,4 +737,372 @@ class RNNLayer(object):
                 return H
 
     def call(self, *args, **kwargs):
-        self.__call__(*args, **kwargs)
\ No newline at end of file
+        self.__call__(*args, **kwargs)
+
+
+class CharCNNLayer(object):
+
+    def __init__(
+            self,
+            training=True,
+            units=None,
+            filter_widths=(1, 2, 3, 4, 5),
+            n_filters=50,
+            n_highway_layers=1,
+            activation='tanh',
+            kernel_initializer='glorot_normal_initializer',
+            bias_initializer='zeros_initializer',
+            name=None,
+            session=None
+    ):
+        self.session = get_session(session)
+
+        self.training = training
+        self.units = units
+        self.filter_widths = filter_widths
+        self.n_filters = n_filters
+        self.n_highway_layers = n_highway_layers
+        self.activation = get_activation(activation, session=self.session, training=self.training)
+        self.kernel_initializer = get_initializer(kernel_initializer, session=self.session)
+        self.bias_initializer = get_initializer(bias_initializer, session=self.session)
+        self.name = name
+
+        self.conv_layers = None
+        self.highway_layers = None
+        self.projection = None
+
+        self.built = False
+
+    def build(self, inputs):
+        if not self.built:
+            with self.session.as_default():
+                with self.session.graph.as_default():
+                    if self.units:
+                        output_dim = self.units
+                    else:
+                        output_dim = inputs.shape[-1]
+
+                    if isinstance(self.n_filters, int):
+                        n_filters = [self.n_filters] * len(self.filter_widths)
+                    else:
+                        n_filters = self.n_filters
+                    pooled_dim = sum(n_filters)
+
+                    self.conv_layers = []
+                    for width, n in zip(self.filter_widths, n_filters):
+                        self.conv_layers.append(tf.layers.Conv1D(
+                            n,
+                            width,
+                            padding='same',
+                            kernel_initializer=self.kernel_initializer,
+                            bias_initializer=self.bias_initializer,
+                            name=self.name + '_w%d' % width
+                        ))
+
+                    self.highway_layers = []
+                    for l in range(self.n_highway_layers):
+                        transform = tf.layers.Dense(
+                            pooled_dim,
+                            kernel_initializer=self.kernel_initializer,
+                            bias_initializer=self.bias_initializer,
+                            name=self.name + '_highway_l%d' % l
+                        )
+                        # Negative gate bias so that the highway layers start out close to the identity
+                        gate = tf.layers.Dense(
+                            pooled_dim,
+                            kernel_initializer=self.kernel_initializer,
+                            bias_initializer=tf.constant_initializer(-1.),
+                            name=self.name + '_highway_gate_l%d' % l
+                        )
+                        self.highway_layers.append((transform, gate))
+
+                    self.projection = tf.layers.Dense(
+                        output_dim,
+                        kernel_initializer=self.kernel_initializer,
+                        bias_initializer=self.bias_initializer,
+                        name=self.name + '_projection'
+                    )
+
+            self.built = True
+
+    def __call__(self, inputs, mask=None):
+        if not self.built:
+            self.build(inputs)
+
+        with self.session.as_default():
+            with self.session.graph.as_default():
+                if mask is None:
+                    mask = tf.ones(tf.shape(inputs)[:-1], dtype=inputs.dtype)
+                # Zero out padding characters so that convolutions see word boundaries as zero padding
+                X = inputs * mask[..., None]
+
+                pooled = []
+                for conv in self.conv_layers:
+                    H = self.activation(conv(X))
+                    # Max-pool over real characters only
+                    H += (mask[..., None] - 1.) * 1e9
+                    pooled.append(tf.reduce_max(H, axis=1))
+                H = tf.concat(pooled, axis=-1)
+                # Words without characters (padding slots) get zero features
+                H *= tf.cast(tf.reduce_any(mask > 0, axis=1), dtype=H.dtype)[..., None]
+
+                for transform, gate in self.highway_layers:
+                    t = tf.sigmoid(gate(H))
+                    H = t * self.activation(transform(H)) + (1. - t) * H
+
+                H = self.projection(H)
+
+                return H
+
+    def call(self, *args, **kwargs):
+        self.__call__(*args, **kwargs)
+
+
+def get_position_encoding(mask, dim):
+    # Sinusoidal position encodings for 'pre'-padded sequences. Positions count real timesteps only,
+    # so the first unpadded timestep of every row is position 0.
+    positions = tf.maximum(tf.cumsum(mask, axis=1) - 1., 0.)
+    n_freq = dim // 2
+    freqs = 1. / tf.pow(10000., tf.range(n_freq, dtype=mask.dtype) * 2. / dim)
+    angles = positions[..., None] * freqs
+    out = tf.concat([tf.sin(angles), tf.cos(angles)], axis=-1)
+    if dim % 2:
+        out = tf.pad(out, [[0, 0], [0, 0], [0, 1]])
+
+    return out * mask[..., None]
+
+
+def layer_normalize(x, gamma, beta, epsilon=1e-6):
+    mean, variance = tf.nn.moments(x, axes=[-1], keep_dims=True)
+    return (x - mean) * tf.rsqrt(variance + epsilon) * gamma + beta
+
+
+class DilatedConvLayer(object):
+
+    def __init__(
+            self,
+            training=True,
+            units=None,
+            kernel_width=3,
+            dilation_rate=1,
+            activation=None,
+            residual=True,
+            kernel_initializer='glorot_normal_initializer',
+            bias_initializer='zeros_initializer',
+            name=None,
+            session=None
+    ):
+        self.session = get_session(session)
+
+        self.training = training
+        self.units = units
+        self.kernel_width = kernel_width
+        self.dilation_rate = dilation_rate
+        self.activation = get_activation(activation, session=self.session, training=self.training)
+        self.residual = residual
+        self.kernel_initializer = get_initializer(kernel_initializer, session=self.session)
+        self.bias_initializer = get_initializer(bias_initializer, session=self.session)
+        self.name = name
+
+        self.conv_layer = None
+        self.projection = None
+
+        self.built = False
+
+    def build(self, inputs):
+        if not self.built:
+            with self.session.as_default():
+                with self.session.graph.as_default():
+                    if self.units:
+                        output_dim = self.units
+                    else:
+                        output_dim = int(inputs.shape[-1])
+
+                    self.conv_layer = tf.layers.Conv1D(
+                        output_dim,
+                        self.kernel_width,
+                        padding='same',
+                        dilation_rate=self.dilation_rate,
+                        kernel_initializer=self.kernel_initializer,
+                        bias_initializer=self.bias_initializer,
+                        name=self.name
+                    )
+
+                    if self.residual and output_dim != int(inputs.shape[-1]):
+                        self.projection = tf.layers.Dense(
+                            output_dim,
+                            use_bias=False,
+                            kernel_initializer=self.kernel_initializer,
+                            name=self.name + '_residual_projection'
+                        )
+
+            self.built = True
+
+    def __call__(self, inputs, mask=None):
+        if not self.built:
+            self.build(inputs)
+
+        with self.session.as_default():
+            with self.session.graph.as_default():
+                # Padding timesteps are zeroed so that they do not leak into the receptive field of real ones
+                if mask is not None:
+                    inputs = inputs * mask[..., None]
+
+                H = self.activation(self.conv_layer(inputs))
+                if self.residual:
+                    if self.projection is None:
+                        H += inputs
+                    else:
+                        H += self.projection(inputs)
+
+                if mask is not None:
+                    H *= mask[..., None]
+
+                return H
+
+    def call(self, *args, **kwargs):
+        self.__call__(*args, **kwargs)
+
+
+class SelfAttentionLayer(object):
+
+    def __init__(
+            self,
+            training=True,
+            units=None,
+            n_heads=4,
+            ff_units=None,
+            activation='relu',
+            kernel_initializer='glorot_normal_initializer',
+            bias_initializer='zeros_initializer',
+            name=None,
+            session=None
+    ):
+        self.session = get_session(session)
+
+        self.training = training
+        self.units = units
+        self.n_heads = n_heads
+        self.ff_units = ff_units
+        self.activation = get_activation(activation, session=self.session, training=self.training)
+        self.kernel_initializer = get_initializer(kernel_initializer, session=self.session)
+        self.bias_initializer = get_initializer(bias_initializer, session=self.session)
+        self.name = name
+
+        self.projection = None
+        self.qkv = None
+        self.attention_output = None
+        self.ff_layers = None
+        self.layer_norm_params = None
+
+        self.built = False
+
+    def build(self, inputs):
+        if not self.built:
+            with self.session.as_default():
+                with self.session.graph.as_default():
+                    if self.units:
+                        output_dim = self.units
+                    else:
+                        output_dim = int(inputs.shape[-1])
+                    assert output_dim % self.n_heads == 0, 'Number of units in a self-attention layer (%d) must be divisible by the number of heads (%d).' % (output_dim, self.n_heads)
+                    if self.ff_units:
+                        ff_dim = self.ff_units
+                    else:
+                        ff_dim = output_dim * 4
+
+                    if output_dim != int(inputs.shape[-1]):
+                        self.projection = tf.layers.Dense(
+                            output_dim,
+                            use_bias=False,
+                            kernel_initializer=self.kernel_initializer,
+                            name=self.name + '_input_projection'
+                        )
+
+                    self.qkv = tf.layers.Dense(
+                        output_dim * 3,
+                        kernel_initializer=self.kernel_initializer,
+                        bias_initializer=self.bias_initializer,
+                        name=self.name + '_qkv'
+                    )
+                    self.attention_output = tf.layers.Dense(
+                        output_dim,
+                        kernel_initializer=self.kernel_initializer,
+                        bias_initializer=self.bias_initializer,
+                        name=self.name + '_attention_output'
+                    )
+                    self.ff_layers = [
+                        tf.layers.Dense(
+                            ff_dim,
+                            kernel_initializer=self.kernel_initializer,
+                            bias_initializer=self.bias_initializer,
+                            name=self.name + '_ff_l0'
+                        ),
+                        tf.layers.Dense(
+                            output_dim,
+                            kernel_initializer=self.kernel_initializer,
+                            bias_initializer=self.bias_initializer,
+                            name=self.name + '_ff_l1'
+                        )
+                    ]
+
+                    self.layer_norm_params = []
+                    for i in range(2):
+                        gamma = tf.get_variable(
+                            self.name + '_layer_norm_%d_gamma' % i,
+                            shape=[output_dim],
+                            initializer=tf.ones_initializer()
+                        )
+                        beta = tf.get_variable(
+                            self.name + '_layer_norm_%d_beta' % i,
+                            shape=[output_dim],
+                            initializer=tf.zeros_initializer()
+                        )
+                        self.layer_norm_params.append((gamma, beta))
+
+            self.built = True
+
+    def __call__(self, inputs, mask=None):
+        if not self.built:
+            self.build(inputs)
+
+        with self.session.as_default():
+            with self.session.graph.as_default():
+                if mask is None:
+                    mask = tf.ones(tf.shape(inputs)[:-1], dtype=inputs.dtype)
+
+                X = inputs
+                if self.projection is not None:
+                    X = self.projection(X)
+
+                B = tf.shape(X)[0]
+                T = tf.shape(X)[1]
+                D = int(X.shape[-1])
+                d_head = D // self.n_heads
+
+                def split_heads(x):
+                    x = tf.reshape(x, [B, T, self.n_heads, d_head])
+                    return tf.transpose(x, [0, 2, 1, 3])
+
+                q, k, v = tf.split(self.qkv(X), 3, axis=-1)
+                q = split_heads(q)
+                k = split_heads(k)
+                v = split_heads(v)
+
+                # Padding timesteps are excluded as keys; their own outputs are zeroed below
+                logits = tf.matmul(q, k, transpose_b=True) / (d_head ** 0.5)
+                logits += (1. - mask)[:, None, None, :] * -1e9
+                A = tf.nn.softmax(logits)
+                H = tf.matmul(A, v)
+                H = tf.reshape(tf.transpose(H, [0, 2, 1, 3]), [B, T, D])
+
+                X = layer_normalize(X + self.attention_output(H), *self.layer_norm_params[0])
+                F = self.ff_layers[1](self.activation(self.ff_layers[0](X)))
+                X = layer_normalize(X + F, *self.layer_norm_params[1])
+
+                X *= mask[..., None]
+
+                return X
+
+    def call(self, *args, **kwargs):
+        self.__call__(*args, **kwargs)
@@ -0,0 +1,54 @@
+import sys
+import os
+import time
+import argparse
+import subprocess
+import numpy as np
+
+from synsemnet.util import stderr
+
+LOADERS = {
+    'load_synsemnet': '''
+from synsemnet.util import load_synsemnet
+m = load_synsemnet(%(model_dir)r)
+''',
+    'load_synsemnet_inference': '''
+from synsemnet.util import load_synsemnet
+m = load_synsemnet(%(model_dir)r, inference=True)
+''',
+    'export': '''
+from synsemnet.export import ExportedSynSemNet
+m = ExportedSynSemNet(%(export_dir)r)
+'''
+}
+
+
+def time_cold_start(code, n_runs):
+    # Each run is a fresh interpreter, so the timings include interpreter startup and imports
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES='-1', TF_CPP_MIN_LOG_LEVEL='3')
+    times = []
+    for _ in range(n_runs):
+        t0 = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env, stderr=subprocess.DEVNULL)
+        times.append(time.time() - t0)
+
+    return np.array(times)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Compares cold-start time (new process to model ready) of loading a SynSemNet model with load_synsemnet (training and inference builds) and from a SavedModel export.
+    ''')
+    argparser.add_argument('model_dir', help='Path to the directory of the trained model.')
+    argparser.add_argument('export_dir', help='Path to the export of the model (see bin/export.py).')
+    argparser.add_argument('-n', '--n_runs', type=int, default=5, help='Number of cold starts to time per loader.')
+    args = argparser.parse_args()
+
+    paths = {'model_dir': args.model_dir, 'export_dir': args.export_dir}
+    baseline = time_cold_start('import tensorflow', args.n_runs)
+
+    stderr('%-26s %10s %10s\n' % ('loader', 'median (s)', 'max (s)'))
+    stderr('%-26s %10.2f %10.2f\n' % ('(import tensorflow only)', np.median(baseline), baseline.max()))
+    for name in ['load_synsemnet', 'load_synsemnet_inference', 'export']:
+        times = time_cold_start(LOADERS[name] % paths, args.n_runs)
+        stderr('%-26s %10.2f %10.2f\n' % (name, np.median(times), times.max()))
@@ -0,0 +1,77 @@
+import os
+import time
+import argparse
+
+from synsemnet.util import stderr
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Benchmarks prediction throughput of an InferencePool against the number of worker processes, on raw tokenized text (one sentence per line).
+    ''')
+    argparser.add_argument('path', help='Path to a trained model directory or an export directory (see bin/export.py).')
+    argparser.add_argument('input', help='Path to the input text file.')
+    argparser.add_argument('-B', '--backend', default='numpy', choices=['auto', 'model', 'export', 'numpy'], help='Backend to run the model with (see bin/serve.py).')
+    argparser.add_argument('-j', '--n_workers', nargs='+', type=int, default=[1, 2, 4, 8], help='Numbers of workers to benchmark.')
+    argparser.add_argument('-t', '--n_threads', type=int, default=1, help='Number of intra-op (TensorFlow) or BLAS (NumPy) threads per worker.')
+    argparser.add_argument('-i', '--inter_op_threads', type=int, default=1, help='Number of TensorFlow inter-op threads per worker.')
+    argparser.add_argument('-b', '--minibatch_size', type=int, default=32, help='Number of sentences per minibatch.')
+    argparser.add_argument('-n', '--n_sentences', type=int, default=10000, help='Maximum number of sentences to read from the input.')
+    argparser.add_argument('-r', '--n_repeats', type=int, default=3, help='Number of timed passes per benchmark (the fastest is reported).')
+    argparser.add_argument('-c', '--force_cpu', action='store_true', help='Do not use GPU.')
+    args = argparser.parse_args()
+
+    if args.force_cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+    # BLAS reads its thread count when NumPy is first imported, so it must be set before the imports below
+    for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ[var] = str(args.n_threads)
+
+    from synsemnet.serving import InferencePool
+
+    with open(args.input, 'r') as f:
+        sentences = []
+        for line in f:
+            if len(sentences) >= args.n_sentences:
+                break
+            sentences.append(line.split())
+    n_words = sum([len(s) for s in sentences])
+    stderr('Benchmarking on %d sentences (%d words)\n' % (len(sentences), n_words))
+
+    stderr('%-8s %12s %14s %14s %8s\n' % ('workers', 'startup (s)', 'sentences/s', 'words/s', 'speedup'))
+    baseline = None
+    reference = None
+    for n_workers in args.n_workers:
+        t0 = time.time()
+        pool = InferencePool(
+            args.path,
+            backend=args.backend,
+            n_workers=n_workers,
+            intra_op_threads=args.n_threads,
+            inter_op_threads=args.inter_op_threads,
+            minibatch_size=args.minibatch_size
+        )
+        # Untimed warmup pass, which also waits for every worker to finish loading
+        out = pool.predict(sentences)
+        startup_time = time.time() - t0
+
+        run_time = float('inf')
+        for _ in range(args.n_repeats):
+            t0 = time.time()
+            pool.predict(sentences)
+            run_time = min(run_time, time.time() - t0)
+        pool.close()
+
+        if baseline is None:
+            baseline = run_time
+            reference = out
+        elif out != reference:
+            stderr('WARNING: predictions with %d workers differ from predictions with %d workers\n' % (n_workers, args.n_workers[0]))
+
+        stderr('%-8d %12.2f %14.1f %14.1f %8.2f\n' % (
+            n_workers,
+            startup_time,
+            len(sentences) / run_time,
+            n_words / run_time,
+            baseline / run_time
+        ))
@@ -0,0 +1,115 @@
+import os
+import time
+import argparse
+import numpy as np
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+import tensorflow as tf
+
+from synsemnet.backend import RNNLayer, make_bi_rnn_layer
+from synsemnet.util import stderr
+
+BACKENDS = [
+    ('keras', False),
+    ('keras', True),
+    ('fused', True)
+]
+
+
+def get_mask(n, max_len, min_len, rng):
+    lengths = rng.randint(min_len, max_len + 1, size=n)
+    mask = (np.arange(max_len)[None, ...] >= (max_len - lengths)[..., None]).astype('float32')
+
+    return mask
+
+
+def time_step(sess, fetches, feed_dict, n_iter, n_warmup):
+    for _ in range(n_warmup):
+        sess.run(fetches, feed_dict=feed_dict)
+    t0 = time.time()
+    for _ in range(n_iter):
+        sess.run(fetches, feed_dict=feed_dict)
+
+    return (time.time() - t0) / n_iter
+
+
+def benchmark(rnn_impl, length_aware, n, max_len, min_len, input_dim, units, n_iter, n_warmup, seed=None):
+    rng = np.random.RandomState(seed)
+    X_in = rng.normal(size=(n, max_len, input_dim)).astype('float32')
+    mask_in = get_mask(n, max_len, min_len, rng)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        sess = tf.Session(graph=graph)
+        with sess.as_default():
+            X = tf.placeholder(tf.float32, shape=[None, None, input_dim], name='X')
+            mask = tf.placeholder(tf.float32, shape=[None, None], name='mask')
+
+            layers = []
+            for direction in ['fwd', 'bwd']:
+                layers.append(RNNLayer(
+                    units=int(units / 2),
+                    activation='tanh',
+                    recurrent_activation='sigmoid',
+                    return_sequences=False,
+                    length_aware=length_aware,
+                    rnn_impl=rnn_impl,
+                    name='rnn_%s' % direction,
+                    session=sess
+                ))
+            rnn = make_bi_rnn_layer(*layers, length_aware=length_aware or rnn_impl == 'fused', session=sess)
+            H = rnn(X, mask=mask)
+
+            loss = tf.reduce_sum(H ** 2)
+            train_op = tf.train.GradientDescentOptimizer(1e-6).minimize(loss)
+
+            sess.run(tf.global_variables_initializer())
+
+            fd = {X: X_in, mask: mask_in}
+            fwd_time = time_step(sess, H, fd, n_iter, n_warmup)
+            train_time = time_step(sess, train_op, fd, n_iter, n_warmup)
+
+        sess.close()
+
+    return fwd_time, train_time
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Benchmarks step time of the available RNN implementations on inputs shaped like the character and word encoders of a SynSemNet model.
+    ''')
+    argparser.add_argument('-b', '--minibatch_size', type=int, default=128, help='Number of sentences per minibatch.')
+    argparser.add_argument('-w', '--n_words', type=int, default=40, help='Maximum number of words per sentence.')
+    argparser.add_argument('-C', '--n_chars', type=int, default=20, help='Maximum number of characters per word.')
+    argparser.add_argument('-e', '--character_embedding_dim', type=int, default=50, help='Dimensionality of character embeddings (input to the character encoder).')
+    argparser.add_argument('-d', '--word_embedding_dim', type=int, default=256, help='Dimensionality of word embeddings (input to the word encoder).')
+    argparser.add_argument('-u', '--n_units', type=int, default=256, help='Number of units in each bidirectional layer.')
+    argparser.add_argument('-n', '--n_iter', type=int, default=20, help='Number of timed steps per benchmark.')
+    argparser.add_argument('-W', '--n_warmup', type=int, default=3, help='Number of untimed warmup steps per benchmark.')
+    argparser.add_argument('-c', '--force_cpu', action='store_true', help='Do not use GPU.')
+    args = argparser.parse_args()
+
+    if args.force_cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+    encoders = [
+        ('char', args.minibatch_size * args.n_words, args.n_chars, 1, args.character_embedding_dim),
+        ('word', args.minibatch_size, args.n_words, 1, args.word_embedding_dim)
+    ]
+
+    stderr('%-8s %-8s %-12s %14s %14s\n' % ('encoder', 'impl', 'length_aware', 'forward (ms)', 'train (ms)'))
+    for encoder, n, max_len, min_len, input_dim in encoders:
+        for rnn_impl, length_aware in BACKENDS:
+            fwd_time, train_time = benchmark(
+                rnn_impl,
+                length_aware,
+                n,
+                max_len,
+                min_len,
+                input_dim,
+                args.n_units,
+                args.n_iter,
+                args.n_warmup,
+                seed=0
+            )
+            stderr('%-8s %-8s %-12s %14.2f %14.2f\n' % (encoder, rnn_impl, length_aware, fwd_time * 1000, train_time * 1000))
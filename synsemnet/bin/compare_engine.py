@@ -0,0 +1,70 @@
+import os
+import time
+import argparse
+import numpy as np
+
+from synsemnet.data import Dataset
+from synsemnet.engine import NumpySynSemNet
+from synsemnet.export import ExportedSynSemNet
+from synsemnet.util import stderr
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Checks that the NumPy engine reproduces the outputs of the TensorFlow graph of an exported SynSemNet model on a parse-label file, and compares their speed.
+    ''')
+    argparser.add_argument('export_dir', help='Path to the export of the model (see bin/export.py).')
+    argparser.add_argument('path', help='Path to a parse-label file.')
+    argparser.add_argument('-b', '--minibatch_size', type=int, default=128, help='Minibatch size.')
+    argparser.add_argument('-t', '--tolerance', type=float, default=1e-4, help='Maximum absolute difference allowed between encodings.')
+    args = argparser.parse_args()
+
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+    t0 = time.time()
+    engine = NumpySynSemNet(args.export_dir)
+    engine_load_time = time.time() - t0
+    t0 = time.time()
+    export = ExportedSynSemNet(args.export_dir)
+    export_load_time = time.time() - t0
+
+    data = Dataset.from_symbol_lists(
+        engine.char_set,
+        engine.word_set,
+        engine.pos_label_set,
+        engine.parse_label_set,
+        engine.parse_label_set
+    )
+    data.initialize_parsing_file(args.path, 'eval')
+    data.cache_numeric_parsing_data('eval', factor_parse_labels=engine.factor_parse_labels)
+
+    max_diff = 0.
+    n_mismatch = 0
+    n_word = 0
+    engine_time = 0.
+    export_time = 0.
+    for batch in data.get_parsing_data_feed('eval', minibatch_size=args.minibatch_size):
+        t0 = time.time()
+        engine_out = engine.encode(batch)
+        engine_out.update(engine.predict_parses(batch))
+        engine_time += time.time() - t0
+
+        t0 = time.time()
+        export_out = export.encode(batch)
+        export_out.update(export.predict_parses(batch))
+        export_time += time.time() - t0
+
+        mask = engine_out['word_mask'] > 0
+        n_word += mask.sum()
+        for k in export_out:
+            if k.startswith('word_encodings'):
+                max_diff = max(max_diff, np.abs(engine_out[k] - export_out[k]).max())
+            elif 'prediction' in k:
+                n_mismatch += (engine_out[k] != export_out[k])[mask].sum()
+
+    stderr('Load time: NumPy %.3fs, TensorFlow %.3fs\n' % (engine_load_time, export_load_time))
+    stderr('Run time: NumPy %.3fs, TensorFlow %.3fs\n' % (engine_time, export_time))
+    stderr('Max absolute difference between encodings: %.2e\n' % max_diff)
+    stderr('Mismatched predictions: %d (over %d words)\n' % (n_mismatch, n_word))
+    if max_diff > args.tolerance:
+        stderr('FAILED: encodings differ by more than %.2e\n' % args.tolerance)
+        exit(1)
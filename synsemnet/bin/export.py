@@ -0,0 +1,21 @@
+import os
+import argparse
+
+from synsemnet.util import load_synsemnet, stderr
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Exports a trained SynSemNet model as a self-contained SavedModel for serving.
+    ''')
+    argparser.add_argument('model_dir', help='Path to the directory of the trained model.')
+    argparser.add_argument('export_dir', help='Path to the export directory (must not exist).')
+    argparser.add_argument('-c', '--force_cpu', action='store_true', help='Do not use GPU.')
+    args = argparser.parse_args()
+
+    if args.force_cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+    stderr('Loading model...\n')
+    m = load_synsemnet(args.model_dir, inference=True)
+    stderr('Exporting model to %s...\n' % args.export_dir)
+    m.export(args.export_dir)
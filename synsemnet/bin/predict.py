@@ -0,0 +1,169 @@
+import os
+import sys
+import argparse
+import collections
+import itertools
+import multiprocessing
+import numpy as np
+
+from synsemnet.data import get_length_buckets
+from synsemnet.engine import EXPORT_METADATA
+from synsemnet.serving import BACKENDS, decode_parse_predictions, get_symbol_dataset, load_predictor_model
+from synsemnet.util import stderr
+
+_worker = {}
+
+
+def initialize_predictor(path, backend, encoders, minibatch_size, catch_errors=False):
+    # In pool workers, load errors are kept and raised on the first chunk rather than raised here,
+    # since a failing pool initializer makes the pool respawn workers forever instead of reporting the error
+    try:
+        model = load_predictor_model(path, backend=backend)
+    except Exception as e:
+        if not catch_errors:
+            raise
+        _worker['error'] = '%s: %s' % (type(e).__name__, e)
+        return
+    _worker['model'] = model
+    _worker['data'] = get_symbol_dataset(model)
+    _worker['encoders'] = encoders
+    _worker['minibatch_size'] = minibatch_size
+
+
+def iter_sentence_chunks(f, chunk_size):
+    # One tokenized sentence per line. Blank lines are kept as empty sentences so that output stays aligned with input.
+    while True:
+        chunk = [line.split() for line in itertools.islice(f, chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def predict_chunk(sentences):
+    """
+    Predict parse labels for a chunk of sentences, batching sentences of similar length together.
+
+    :param sentences: ``list`` of ``list`` of ``str``; sentences as lists of words.
+    :return: ``dict``; map from encoder to output text for the chunk, in input order, in the tab-separated format of ``Dataset.parse_predictions_to_sequences``.
+    """
+    if 'error' in _worker:
+        raise RuntimeError('Failed to load the model in a worker process: %s' % _worker['error'])
+
+    model = _worker['model']
+    data = _worker['data']
+    encoders = _worker['encoders']
+
+    n_words = np.array([len(s) for s in sentences])
+    max_chars = np.array([max([len(w) for w in s]) if s else 0 for s in sentences])
+    out = {e: [None] * len(sentences) for e in encoders}
+    for ix in get_length_buckets(n_words, max_chars, _worker['minibatch_size']):
+        batch_sentences = [sentences[i] for i in ix if n_words[i] > 0]
+        if batch_sentences:
+            batch = data.parsing_text_to_batch(batch_sentences)
+            decoded = decode_parse_predictions(
+                data,
+                model.run(batch, signature='parse'),
+                batch['parsing_text_mask'].any(axis=-1),
+                factor_parse_labels=model.factor_parse_labels,
+                encoders=encoders
+            )
+        j = 0
+        for i in ix:
+            for e in encoders:
+                if n_words[i] > 0:
+                    lines = zip(sentences[i], decoded['pos_%s' % e][j], decoded['parse_%s' % e][j])
+                    out[e][i] = ''.join(['\t'.join(x) + '\n' for x in lines]) + '\n'
+                else:
+                    out[e][i] = '\n'
+            if n_words[i] > 0:
+                j += 1
+
+    return {e: ''.join(out[e]) for e in encoders}
+
+
+def predict_serial(chunks):
+    for chunk in chunks:
+        yield predict_chunk(chunk)
+
+
+def get_result(result, timeout):
+    try:
+        return result.get(timeout=timeout)
+    except multiprocessing.TimeoutError:
+        # A worker that dies mid-chunk (e.g. killed for running out of memory) is replaced, but its chunk is lost
+        raise RuntimeError('No result from the worker processes after %s seconds. A worker may have died.' % timeout)
+
+
+def predict_parallel(chunks, n_workers, initargs, timeout=None):
+    # Keep a bounded number of chunks in flight so that memory stays constant however large the input is,
+    # and collect results in submission order
+    pool = multiprocessing.Pool(n_workers, initializer=initialize_predictor, initargs=initargs + (True,))
+    try:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(predict_chunk, (chunk,)))
+            if len(pending) >= 2 * n_workers:
+                yield get_result(pending.popleft(), timeout)
+        while pending:
+            yield get_result(pending.popleft(), timeout)
+    finally:
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Predicts POS tags and parse labels for raw tokenized text (one sentence per line, words separated by whitespace) with a trained SynSemNet model.
+    Input is read and predictions are written incrementally in the tab-separated format of the parse sequence files written during evaluation (word, POS tag and parse label per line, blank line between sentences), so memory use does not grow with corpus size.
+    ''')
+    argparser.add_argument('path', help='Path to a trained model directory or an export directory (see bin/export.py).')
+    argparser.add_argument('input', nargs='?', default='-', help='Path to the input text file ("-" for stdin).')
+    argparser.add_argument('-o', '--output', default=None, help='Output path prefix. Predictions from encoder <e> are written to <output>_<e>_parse_seqs.txt. If unspecified, predictions are written to stdout (requires a single encoder).')
+    argparser.add_argument('-e', '--encoders', nargs='+', default=['syn'], choices=['syn', 'sem'], help='Encoder(s) to predict from.')
+    argparser.add_argument('-B', '--backend', default='auto', choices=BACKENDS, help='Backend to run the model with (see bin/serve.py).')
+    argparser.add_argument('-b', '--minibatch_size', type=int, default=128, help='Number of sentences per minibatch.')
+    argparser.add_argument('-C', '--chunk_size', type=int, default=8192, help='Number of sentences read at a time and sorted by length for batching. Memory use scales with chunk size times the number of workers.')
+    argparser.add_argument('-j', '--n_workers', type=int, default=1, help='Number of worker processes, each with its own copy of the model.')
+    argparser.add_argument('-T', '--timeout', type=float, default=3600., help='Maximum time in seconds to wait for a worker process to finish a chunk (with -j > 1).')
+    argparser.add_argument('-c', '--force_cpu', action='store_true', help='Do not use GPU.')
+    args = argparser.parse_args()
+
+    if args.force_cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+    if args.output is None and len(args.encoders) > 1:
+        argparser.error('An output prefix (-o) is required to predict from more than one encoder.')
+    if not os.path.isdir(args.path):
+        argparser.error('Model directory "%s" does not exist.' % args.path)
+    if args.backend == 'numpy' and not os.path.exists(os.path.join(args.path, EXPORT_METADATA)):
+        argparser.error('The numpy backend requires an export directory (see bin/export.py).')
+
+    if args.input == '-':
+        f_in = sys.stdin
+    else:
+        f_in = open(args.input, 'r')
+
+    if args.output is None:
+        f_out = {args.encoders[0]: sys.stdout}
+    else:
+        f_out = {e: open('%s_%s_parse_seqs.txt' % (args.output, e), 'w') for e in args.encoders}
+
+    initargs = (args.path, args.backend, args.encoders, args.minibatch_size)
+    chunks = iter_sentence_chunks(f_in, args.chunk_size)
+    if args.n_workers > 1:
+        results = predict_parallel(chunks, args.n_workers, initargs, timeout=args.timeout)
+    else:
+        initialize_predictor(*initargs)
+        results = predict_serial(chunks)
+
+    for i, out in enumerate(results):
+        for e in out:
+            f_out[e].write(out[e])
+            f_out[e].flush()
+        stderr('\rProcessed %d chunk(s)' % (i + 1))
+    stderr('\n')
+
+    if f_in is not sys.stdin:
+        f_in.close()
+    for e in f_out:
+        if f_out[e] is not sys.stdout:
+            f_out[e].close()
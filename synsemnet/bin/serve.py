@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import queue
+import threading
+import argparse
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synsemnet.serving import BACKENDS, BatchingPredictor, load_predictor_model
+from synsemnet.util import stderr
+
+ENDPOINTS = {
+    '/parse': 'parse',
+    '/encode': 'encode'
+}
+
+
+class SynSemNetRequestHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, obj, headers=None):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if headers is not None:
+            for k in headers:
+                self.send_header(k, headers[k])
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=None):
+        with self.server.counter_lock:
+            self.server.n_errors[status] = self.server.n_errors.get(status, 0) + 1
+        self._send_json(status, {'error': message}, headers=headers)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            predictor = self.server.predictor
+            stats = predictor.get_stats()
+            uptime = time.time() - self.server.t_start
+            stats['uptime'] = uptime
+            stats['requests_per_second'] = stats['n_requests'] / uptime
+            stats['sentences_per_second'] = stats['n_sentences'] / uptime
+            stats['latency'] = {
+                'p%d' % p: v for p, v in predictor.get_latency_percentiles((50, 90, 99)).items()
+            }
+            with self.server.counter_lock:
+                stats['n_errors'] = {str(k): v for k, v in self.server.n_errors.items()}
+            self._send_json(200, stats)
+        else:
+            self._send_error(404, 'Unknown endpoint "%s".' % self.path)
+
+    def do_POST(self):
+        if self.path not in ENDPOINTS:
+            self._send_error(404, 'Unknown endpoint "%s".' % self.path)
+            return
+        signature = ENDPOINTS[self.path]
+
+        if self.headers.get('Content-Length') is None:
+            self._send_error(411, 'Request must have a Content-Length header.')
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_error(400, 'Invalid Content-Length header.')
+            return
+        if length > self.server.max_request_bytes:
+            self._send_error(413, 'Request body exceeds %d bytes.' % self.server.max_request_bytes)
+            return
+        try:
+            sentences = json.loads(self.rfile.read(length).decode('utf-8'))['sentences']
+            # Sentences may be given as lists of words or as whitespace-tokenized strings
+            sentences = [s.split() if isinstance(s, str) else [str(w) for w in s] for s in sentences]
+        except (ValueError, KeyError, TypeError):
+            self._send_error(400, 'Request body must be a JSON object with a "sentences" list.')
+            return
+        if len(sentences) > self.server.max_request_sentences:
+            self._send_error(413, 'Request exceeds %d sentences.' % self.server.max_request_sentences)
+            return
+
+        try:
+            future = self.server.predictor.submit(sentences, signature=signature)
+        except queue.Full:
+            self._send_error(503, 'Server is overloaded, retry later.', headers={'Retry-After': '1'})
+            return
+
+        try:
+            results = future.result(timeout=self.server.request_timeout)
+        except concurrent.futures.TimeoutError:
+            self._send_error(504, 'Prediction timed out.')
+            return
+        except Exception as e:
+            self._send_error(500, 'Prediction failed: %s' % e)
+            return
+
+        if signature == 'encode':
+            results = [{k: r[k].tolist() for k in r} for r in results]
+        self._send_json(200, {'sentences': results})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('''
+    Serves predictions from a SynSemNet model over local HTTP. Concurrent requests are coalesced into shared minibatches.
+
+    Endpoints:
+        POST /parse   {"sentences": [["The", "dog", "barked"], "A whitespace tokenized sentence", ...]} -> POS tags and parse labels per word
+        POST /encode  same input -> syntactic and semantic word encodings
+        GET  /stats   throughput, latency percentiles and queue counters
+        GET  /health
+    ''', formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument('path', help='Path to a trained model directory or an export directory (see bin/export.py).')
+    argparser.add_argument('-B', '--backend', default='auto', choices=BACKENDS, help='Backend to run the model with. "auto" uses the exported graph for export directories and an inference build otherwise. "numpy" (export directories only) runs without TensorFlow.')
+    argparser.add_argument('-H', '--host', default='127.0.0.1', help='Host to bind to.')
+    argparser.add_argument('-p', '--port', type=int, default=8080, help='Port to bind to.')
+    argparser.add_argument('-b', '--max_batch_size', type=int, default=64, help='Maximum number of sentences per minibatch.')
+    argparser.add_argument('-t', '--max_tokens', type=int, default=2048, help='Maximum number of padded word slots per minibatch.')
+    argparser.add_argument('-w', '--max_wait', type=float, default=0.005, help='Maximum time in seconds a request waits to be batched with others.')
+    argparser.add_argument('-q', '--max_queue_size', type=int, default=256, help='Maximum number of queued requests. Requests beyond this are rejected with status 503.')
+    argparser.add_argument('-s', '--max_request_sentences', type=int, default=1024, help='Maximum number of sentences per request.')
+    argparser.add_argument('-m', '--max_request_bytes', type=int, default=2**24, help='Maximum request body size in bytes.')
+    argparser.add_argument('-T', '--request_timeout', type=float, default=60., help='Maximum time in seconds to wait for a prediction.')
+    argparser.add_argument('-c', '--force_cpu', action='store_true', help='Do not use GPU.')
+    argparser.add_argument('-v', '--verbose', action='store_true', help='Log every request.')
+    args = argparser.parse_args()
+
+    if args.force_cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+    stderr('Loading model...\n')
+    model = load_predictor_model(args.path, backend=args.backend)
+    predictor = BatchingPredictor(
+        model,
+        max_batch_size=args.max_batch_size,
+        max_tokens=args.max_tokens,
+        max_wait=args.max_wait,
+        max_queue_size=args.max_queue_size
+    )
+
+    server = ThreadingHTTPServer((args.host, args.port), SynSemNetRequestHandler)
+    server.daemon_threads = True
+    server.predictor = predictor
+    server.max_request_sentences = args.max_request_sentences
+    server.max_request_bytes = args.max_request_bytes
+    server.request_timeout = args.request_timeout
+    server.verbose = args.verbose
+    server.t_start = time.time()
+    server.n_errors = {}
+    server.counter_lock = threading.Lock()
+
+    stderr('Serving on http://%s:%d\n' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        predictor.close()
@@ -1,11 +1,10 @@
 import sys
 import os
-import pickle
 import argparse
 
 from synsemnet.config import Config
 from synsemnet.kwargs import SYN_SEM_NET_KWARGS
-from synsemnet.data import Dataset
+from synsemnet.data import Dataset, get_preprocessing_fingerprint
 from synsemnet.model import SynSemNet
 from synsemnet.util import stderr
 
@@ -14,7 +13,9 @@ if __name__ == '__main__':
     Trains a SynSemNet model from a config file.
     ''')
     argparser.add_argument('config', help='Path to configuration file.')
-    argparser.add_argument('-P', '--preprocess', action='store_true', help='Preprocess data (even if saved data object exists in the model directory)')
+    argparser.add_argument('-P', '--preprocess', action='store_true', help='Preprocess data (even if a cached copy preprocessed from the same inputs and options exists)')
+    argparser.add_argument('-C', '--chunk_size', type=int, default=None, help='If specified, stream parsing data from disk in chunks of this many sentences during preprocessing instead of reading it into memory.')
+    argparser.add_argument('-j', '--n_workers', type=int, default=1, help='Number of processes to use for preprocessing parsing data.')
     argparser.add_argument('-c', '--force_cpu', action='store_true', help='Do not use GPU. If not specified, GPU usage defaults to the value of the **use_gpu_if_available** configuration parameter.')
     args = argparser.parse_args()
 
@@ -28,40 +29,55 @@ if __name__ == '__main__':
     for kwarg in SYN_SEM_NET_KWARGS:
         kwargs[kwarg.key] = p[kwarg.key]
 
-    data_path = 'data'
-    if p['os']:
-        data_path += '_os'
-    if p['root']:
-        data_path += '_root'
-    data_path += '.obj'
+    if p['hybrid_word_embeddings']:
+        word_min_count = p['word_min_count']
+    else:
+        word_min_count = None
+
+    fingerprint = get_preprocessing_fingerprint(
+        [p.parsing_train_data_path, p.parsing_dev_data_path, p.sts_train_data_path],
+        factor_parse_labels=p['factor_parse_labels'],
+        word_min_count=word_min_count,
+        os=p['os'],
+        root=p['root']
+    )
+    data_path = os.path.join(p.data_cache_dir, fingerprint)
 
-    if not args.preprocess and os.path.exists(data_path):
-        with open(data_path, 'rb') as f:
-            stderr('Loading data...\n')
-            data = pickle.load(f)
+    if not args.preprocess and Dataset.numeric_cache_exists(data_path):
+        stderr('Loading data...\n')
+        data = Dataset.load_numeric_cache(data_path)
     else:
         stderr('Reading and processing data...\n')
-        data = Dataset(p.parsing_train_data_path, p.sts_train_data_path)
-        data.initialize_parsing_file(p.parsing_dev_data_path, 'dev')
-        with open(data_path, 'wb') as f:
-            pickle.dump(data, f)
+        stream = args.chunk_size is not None or args.n_workers > 1
+        data = Dataset(
+            p.parsing_train_data_path,
+            p.sts_train_data_path,
+            chunk_size=args.chunk_size,
+            n_workers=args.n_workers,
+            word_min_count=word_min_count
+        )
+        data.initialize_parsing_file(p.parsing_dev_data_path, 'dev', stream=stream)
+
+        stderr('Caching numeric train data...\n')
+        data.cache_numeric_parsing_data(name='train', factor_parse_labels=p['factor_parse_labels'], chunk_size=args.chunk_size, n_workers=args.n_workers)
+        stderr('Caching numeric dev data...\n')
+        data.cache_numeric_parsing_data(name='dev', factor_parse_labels=p['factor_parse_labels'], chunk_size=args.chunk_size, n_workers=args.n_workers)
 
-    stderr('Caching numeric train data...\n')
-    data.cache_numeric_parsing_data(name='train', factor_parse_labels=p['factor_parse_labels'])
-    stderr('Caching numeric dev data...\n')
-    data.cache_numeric_parsing_data(name='dev', factor_parse_labels=p['factor_parse_labels'])
+        stderr('Saving numeric data...\n')
+        data.save_numeric_cache(data_path)
 
     char_set = data.char_list
     pos_label_set = data.pos_label_list
     if p['factor_parse_labels']:
         parse_label_set = data.parse_ancestor_list
     else:
-        parse_label_set = data.parse_label_lis
+        parse_label_set = data.parse_label_list
 
     m = SynSemNet(
         char_set,
         pos_label_set,
         parse_label_set,
+        word_set=data.word_list,
         **kwargs
     )
 
@@ -25,6 +25,8 @@ class Config(object):
         self.sts_dev_data_path = data.get('sts_dev_data_path', './')
         self.sts_test_data_path = data.get('sts_test_data_path', './')
 
+        self.data_cache_dir = data.get('data_cache_dir', './data_cache/')
+
         # SETTINGS
         # Output directory
         settings = config['settings']
@@ -1,4 +1,14 @@
+import os
+import io
+import json
 import math
+import queue
+import shutil
+import hashlib
+import itertools
+import collections
+import threading
+import multiprocessing
 import numpy as np
 
 from synsemnet.util import stderr
@@ -45,6 +55,115 @@ def get_parse_ancestor_set(parse_labels):
     return sorted(list(parse_ancestor_set))
 
 
+def prefetch(feed, depth=1):
+    """
+    Iterate over **feed** in a background thread, keeping up to **depth** items ready ahead of the consumer.
+    Exceptions raised by **feed** are re-raised in the consuming thread.
+
+    :param feed: iterable; the feed to prefetch from.
+    :param depth: ``int``; maximum number of items to prepare ahead.
+    :return: generator
+    """
+    done = object()
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up once the consumer has stopped, so that a full queue never blocks the producer forever
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for x in feed:
+                if not put((x, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+
+    try:
+        while True:
+            x, err = q.get()
+            if x is done:
+                if err is not None:
+                    raise err
+                break
+            yield x
+    finally:
+        stop.set()
+
+
+def merge_ragged_parsing_chunks(chunks, factor_parse_labels=True):
+    """
+    Merge ragged numeric parsing chunks (as returned by ``Dataset.parsing_chunk_to_ragged_seqs``), in order,
+    into a single ragged numeric cache with sentence and word offsets.
+
+    :param chunks: ``list`` of ``dict``; numeric chunks.
+    :param factor_parse_labels: ``bool``; whether parse labels were factored into depth and ancestor.
+    :return: ``dict``; merged numeric cache.
+    """
+    def concat(key):
+        if len(chunks) == 0:
+            return np.zeros([0], dtype='int64')
+        return np.concatenate([x[key] for x in chunks])
+
+    sentence_offsets = get_offsets(concat('sentence_lengths'))
+    word_offsets = get_offsets(concat('word_lengths'))
+    out = {
+        'parsing_sentence_offsets': sentence_offsets.astype(get_int_dtype(sentence_offsets)),
+        'parsing_word_offsets': word_offsets.astype(get_int_dtype(word_offsets))
+    }
+
+    keys = ['parsing_text', 'parsing_words', 'pos_label', 'parse_label']
+    if factor_parse_labels:
+        keys.append('parse_depth')
+    else:
+        out['parse_depth'] = None
+    for k in keys:
+        values = concat(k)
+        out[k] = values.astype(get_int_dtype(values))
+
+    return out
+
+
+def get_preprocessing_fingerprint(paths, chunk_size=2**20, **options):
+    """
+    Compute a fingerprint of preprocessing inputs, for use as a key into a cache of preprocessed data.
+    The fingerprint covers the paths, the contents of all paths that are files, the preprocessing options,
+    and the numeric cache format version.
+
+    :param paths: ``list`` of ``str``; paths to source data.
+    :param chunk_size: ``int``; number of bytes to read at a time while hashing file contents.
+    :param options: preprocessing options. Values must be JSON-serializable.
+    :return: ``str``; hexadecimal fingerprint.
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps({
+        'version': Dataset.NUMERIC_CACHE_VERSION,
+        'paths': [None if x is None else os.path.realpath(x) for x in paths],
+        'options': options
+    }, sort_keys=True).encode('utf-8'))
+
+    for path in paths:
+        if path is not None and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    h.update(chunk)
+        h.update(b'\0')
+
+    return h.hexdigest()
+
+
 def get_random_permutation(n):
     p = np.random.permutation(np.arange(n))
     p_inv = np.zeros_like(p)
@@ -52,54 +171,266 @@ def get_random_permutation(n):
     return p, p_inv
 
 
-def pad_sequence(x, out=None, seq_shape=None, cur_ix=None, dtype='float32', reverse_axes=None, padding='pre', value=0.):
-    assert padding.lower() in ['pre', 'post'], 'Padding type "%s" not recognized' % padding
-    if seq_shape is None:
-        seq_shape = shape(x)
+def get_length_buckets(n_words, max_chars, minibatch_size, randomize=False, max_tokens=None):
+    """
+    Partition sentences into minibatches of similar shape by sorting on word count, then on maximum word length.
+    If **randomize**, ties are broken at random and both the order of the minibatches and the order of sentences
+    within each minibatch are shuffled.
+
+    :param n_words: ``numpy`` array; number of words in each sentence.
+    :param max_chars: ``numpy`` array; length of the longest word in each sentence.
+    :param minibatch_size: ``int`` or ``None``; maximum number of sentences per minibatch (unlimited if ``None``).
+    :param randomize: ``bool``; shuffle within and across buckets.
+    :param max_tokens: ``int`` or ``None``; if not ``None``, also cap the number of padded word slots (sentences times the word count of the longest sentence) per minibatch. A sentence longer than the budget gets a minibatch of its own.
+    :return: ``list`` of ``numpy`` arrays of sentence indices, one per minibatch.
+    """
+    n = len(n_words)
+    if minibatch_size is None:
+        minibatch_size = max(n, 1)
+    if randomize:
+        tiebreak = np.random.random(n)
+    else:
+        tiebreak = np.arange(n)
+    ix = np.lexsort((tiebreak, max_chars, n_words))
+
+    if max_tokens is None:
+        batches = [ix[i:i+minibatch_size] for i in range(0, n, minibatch_size)]
+    else:
+        # Sentences are sorted by word count, so the last sentence of a minibatch sets its padded length
+        batches = []
+        start = 0
+        for i in range(1, n + 1):
+            if i == n or i - start >= minibatch_size or (i + 1 - start) * n_words[ix[i]] > max_tokens:
+                batches.append(ix[start:i])
+                start = i
+    if randomize:
+        batches = [batches[i] for i in np.random.permutation(len(batches))]
+        batches = [np.random.permutation(x) for x in batches]
+
+    return batches
+
+
+def get_word_types(chars, mask):
+    """
+    Find the unique words (rows of characters and character mask) in a padded minibatch.
+
+    :param chars: ``numpy`` array; character ids, shape [B, W, C].
+    :param mask: ``numpy`` array; character mask, shape [B, W, C].
+    :return: ``tuple`` of ``numpy`` arrays; character ids of each type [T, C], character mask of each type [T, C], and the type index of each token slot [B, W].
+    """
+    B, W, C = chars.shape
+    chars = chars.reshape(B * W, C)
+    mask = mask.reshape(B * W, C)
+    key = np.concatenate([chars, (mask > 0).astype(chars.dtype)], axis=-1)
+    types, type_ix = np.unique(key, axis=0, return_inverse=True)
+
+    return types[:, :C], types[:, C:].astype(mask.dtype), type_ix.reshape(B, W)
+
+
+def get_parsing_inputs(batch, hybrid_word_embeddings=False, dedup_word_types=False):
+    """
+    Compute the model inputs for a padded parsing minibatch, keyed by the names of the corresponding input placeholders.
+
+    :param batch: ``dict``; padded minibatch, as returned by ``Dataset.get_parsing_batch``.
+    :param hybrid_word_embeddings: ``bool``; whether the model looks up in-vocabulary words in a word embedding table.
+    :param dedup_word_types: ``bool``; whether the model encodes each word type once per minibatch.
+    :return: ``dict``; map from input name to ``numpy`` array.
+    """
+    out = {
+        'parsing_characters': batch['parsing_text'],
+        'parsing_character_mask': batch['parsing_text_mask']
+    }
+    if hybrid_word_embeddings:
+        out['parsing_words'] = batch['parsing_words']
+    if dedup_word_types:
+        characters = batch['parsing_text']
+        character_mask = batch['parsing_text_mask']
+        if hybrid_word_embeddings:
+            # Only out-of-vocabulary words need character encodings, so all other words collapse into the empty type
+            oov = (batch['parsing_words'] == 0)[..., None]
+            characters = characters * oov
+            character_mask = character_mask * oov
+        word_types, word_type_mask, word_type_ix = get_word_types(characters, character_mask)
+        out['parsing_word_type_characters'] = word_types
+        out['parsing_word_type_character_mask'] = word_type_mask
+        out['parsing_word_type_ix'] = word_type_ix
+
+    return out
+
+
+def concatenate_padded(arrays, axis=0, padding='pre', value=0):
+    """
+    Concatenate padded arrays along **axis**, first padding all other axes to their maximum size.
 
-    if out is None:
-        out = np.full(seq_shape, value, dtype=dtype)
+    :param arrays: ``list`` of ``numpy`` arrays of equal rank.
+    :param axis: ``int``; axis along which to concatenate.
+    :param padding: ``str``; ``'pre'`` or ``'post'``.
+    :param value: Padding value.
+    :return: ``numpy`` array
+    """
+    assert padding.lower() in ['pre', 'post'], 'Padding type "%s" not recognized' % padding
+    shape = np.max([x.shape for x in arrays], axis=0)
+    out = []
+    for x in arrays:
+        pad_width = []
+        for a in range(x.ndim):
+            if a == axis % x.ndim:
+                pad_width.append((0, 0))
+            elif padding.lower() == 'pre':
+                pad_width.append((shape[a] - x.shape[a], 0))
+            else:
+                pad_width.append((0, shape[a] - x.shape[a]))
+        if any(w != (0, 0) for w in pad_width):
+            x = np.pad(x, pad_width, mode='constant', constant_values=value)
+        out.append(x)
+
+    return np.concatenate(out, axis=axis)
+
+
+def get_offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype='int64')
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def ragged_range(starts, lengths):
+    # Concatenation of np.arange(s, s + l) for each (s, l) in zip(starts, lengths)
+    starts = np.asarray(starts, dtype='int64')
+    lengths = np.asarray(lengths, dtype='int64')
+    offsets = get_offsets(lengths)
+    return np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+
+def get_int_dtype(values):
+    # Narrowest integer dtype that can represent all of values
+    values = np.asarray(values)
+    if values.size == 0:
+        return np.dtype('uint8')
+    lo = values.min()
+    hi = values.max()
+    if lo < 0:
+        # Keep both bounds signed so that e.g. [-1, 255] maps to int16 rather than promoting int8 and uint8
+        hi = -hi - 1
+    return np.result_type(np.min_scalar_type(lo), np.min_scalar_type(hi))
+
+
+def ragged_positions(lengths, max_len=None, reverse=False, padding='pre'):
+    # For each element of a flat ragged array, return the index of the row it belongs to and its
+    # position along the padded axis.
+    lengths = np.asarray(lengths, dtype='int64')
+    if max_len is None:
+        max_len = lengths.max() if len(lengths) > 0 else 0
+    offsets = get_offsets(lengths)
+    row = np.repeat(np.arange(len(lengths)), lengths)
+    pos = np.arange(offsets[-1]) - offsets[row]
+    if reverse:
+        pos = lengths[row] - 1 - pos
+    if padding.lower() == 'pre':
+        pos += max_len - lengths[row]
+    return row, pos
+
+
+def flatten_ragged(seqs, rank=None):
+    """
+    Flatten nested sequences into a flat value array and one array of lengths per ragged axis.
+
+    :param seqs: Nested ``list`` (or ``tuple``) of sequences.
+    :param rank: ``int`` or ``None``; number of axes in **seqs**. If ``None``, inferred from the first non-empty path.
+    :return: ``tuple``; flat ``numpy`` array of values and ``list`` of ``numpy`` arrays of lengths, one per axis but the last.
+    """
+    if rank is None:
+        rank = 1
+        cur = seqs
+        while cur is not None:
+            subseqs = [y for y in cur if isinstance(y, (list, tuple, np.ndarray))]
+            if len(subseqs) > 0:
+                rank += 1
+            cur = next((y for y in subseqs if len(y) > 0), None)
+
+    lengths = []
+    cur = seqs
+    for _ in range(rank - 1):
+        lengths.append(np.fromiter(map(len, cur), dtype='int64', count=len(cur)))
+        cur = list(itertools.chain.from_iterable(cur))
+    values = np.array(cur)
+
+    return values, lengths
+
+
+def pad_ragged(
+        values,
+        lengths,
+        seq_shape=None,
+        dtype='float32',
+        reverse_axes=None,
+        padding='pre',
+        value=0.,
+        return_mask=False,
+        mask_dtype='float32'
+):
+    """
+    Pack a flat ragged array into a dense padded array in a fixed number of vectorized passes.
+
+    :param values: ``numpy`` array; flat values, in row-major order.
+    :param lengths: ``list`` of ``numpy`` arrays; lengths of each ragged axis. **lengths[0]** has one entry per row of the output, **lengths[i]** has one entry per element of axis **i**.
+    :param seq_shape: ``list`` or ``None``; shape of the output. If ``None``, the smallest shape that fits the data.
+    :param dtype: ``str`` or ``numpy`` dtype; dtype of the output.
+    :param reverse_axes: ``list``, ``True`` or ``None``; axes along which to reverse the (unpadded) elements. If ``True``, reverse all axes.
+    :param padding: ``str``; ``'pre'`` or ``'post'``.
+    :param value: Padding value.
+    :param return_mask: ``bool``; also return a mask with ones at non-padding positions.
+    :param mask_dtype: ``str`` or ``numpy`` dtype; dtype of the mask.
+    :return: ``numpy`` array, or ``tuple`` of padded array and mask if **return_mask** is ``True``.
+    """
+    assert padding.lower() in ['pre', 'post'], 'Padding type "%s" not recognized' % padding
 
-    if cur_ix is None:
-        cur_ix = []
+    if seq_shape is None:
+        if len(lengths) > 0:
+            seq_shape = [len(lengths[0])] + [x.max() if len(x) > 0 else 0 for x in lengths]
+        else:
+            seq_shape = [len(values)]
+    seq_shape = [int(x) for x in seq_shape]
 
     if reverse_axes is None:
         reverse_axes = tuple()
     elif reverse_axes is True:
         reverse_axes = tuple(range(len(seq_shape)))
-    elif not isinstance(reverse_axes, list):
+    else:
         reverse_axes = tuple(reverse_axes)
 
-    reverse = len(cur_ix) in reverse_axes
+    # Axis 0 is a single ragged row of rows, so it is padded and reversed the same way as the inner axes.
+    n_rows = len(lengths[0]) if len(lengths) > 0 else len(values)
+    _, pos = ragged_positions([n_rows], max_len=seq_shape[0], reverse=0 in reverse_axes, padding=padding)
+    ix = [pos]
 
-    if hasattr(x, '__getitem__'):
-        if padding.lower() == 'post':
-            s = 0
-            e = len(x)
-        else:
-            e = seq_shape[len(cur_ix)]
-            s = e - len(x)
-        for i, y in enumerate(x):
-            if reverse:
-                ix = cur_ix + [e - 1 - i]
-            else:
-                ix = cur_ix + [s + i]
-            pad_sequence(
-                y,
-                out=out,
-                seq_shape=seq_shape,
-                cur_ix=ix,
-                dtype=dtype,
-                reverse_axes=reverse_axes,
-                padding=padding,
-                value=value
-            )
-    else:
-        out[tuple(cur_ix)] = x
+    for a, l in enumerate(lengths):
+        row, pos = ragged_positions(l, max_len=seq_shape[a + 1], reverse=(a + 1) in reverse_axes, padding=padding)
+        ix = [x[row] for x in ix] + [pos]
+
+    out = np.full(seq_shape, value, dtype=dtype)
+    out[tuple(ix)] = values
+
+    if return_mask:
+        mask = np.zeros(seq_shape, dtype=mask_dtype)
+        mask[tuple(ix)] = 1
+        return out, mask
 
     return out
 
 
+def pad_sequence(x, seq_shape=None, dtype='float32', reverse_axes=None, padding='pre', value=0.):
+    values, lengths = flatten_ragged(x, rank=None if seq_shape is None else len(seq_shape))
+    return pad_ragged(
+        values,
+        lengths,
+        seq_shape=seq_shape,
+        dtype=dtype,
+        reverse_axes=reverse_axes,
+        padding=padding,
+        value=value
+    )
+
+
 def rank(seqs):
     r = 0
     new_r = r
@@ -122,32 +453,152 @@ def shape(seqs, s=None, rank=0):
     return s
 
 
-def read_parse_label_file(path):
+def iter_lines(path, start=None, end=None):
+    if start is None and end is None:
+        with open(path, 'r') as f:
+            for l in f:
+                yield l
+    else:
+        # Byte ranges require binary mode, so decode manually
+        if start is None:
+            start = 0
+        with open(path, 'rb') as f:
+            f.seek(start)
+            pos = start
+            for l in f:
+                if end is not None and pos >= end:
+                    break
+                pos += len(l)
+                yield l.decode('utf-8')
+
+
+def get_file_shards(path, n_shards):
+    """
+    Split a parse label file into up to **n_shards** byte ranges of similar size, each of which begins at a
+    sentence boundary (immediately after a blank line).
+
+    :param path: ``str``; path to the parse label file.
+    :param n_shards: ``int``; maximum number of shards.
+    :return: ``list`` of ``tuple`` of ``int``; start (inclusive) and end (exclusive) byte offsets of each shard, in file order.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, n_shards):
+            start = max(size * i // n_shards, bounds[-1])
+            if start >= size:
+                break
+            if start > 0:
+                # Move to the beginning of the first line starting at or after the target offset
+                f.seek(start - 1)
+                f.readline()
+            while True:
+                l = f.readline()
+                if l == b'':
+                    bound = size
+                    break
+                if l.strip() == b'':
+                    bound = f.tell()
+                    break
+            bounds.append(bound)
+    bounds.append(size)
+
+    return [(s, e) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+
+def iter_parse_label_file(path, chunk_size=None, start=None, end=None):
+    """
+    Lazily read a parse label file, holding at most one chunk of sentences in memory at a time.
+
+    :param path: ``str``; path to the parse label file.
+    :param chunk_size: ``int`` or ``None``; if ``None``, yield one sentence at a time as a ``tuple`` of ``list`` (words, POS labels, parse labels). Otherwise, yield ``tuple`` of ``list`` of up to **chunk_size** sentences, in the format returned by ``read_parse_label_file``.
+    :param start: ``int`` or ``None``; byte offset at which to start reading. Must be at a sentence boundary.
+    :param end: ``int`` or ``None``; byte offset at which to stop reading. Must be at a sentence boundary.
+    :return: generator
+    """
     text = []
     pos_label = []
     parse_label = []
     text_cur = []
     pos_label_cur = []
     parse_label_cur = []
-    with open(path, 'r') as f:
-        for l in f:
-            if l.strip() == '':
-                assert len(text_cur) == len(pos_label_cur) == len(parse_label_cur), 'Mismatched text and labels: [%s] vs. [%s] vs. [%s].' % (' '.join(text_cur), ' '.join(pos_label_cur), ' '.join(parse_label_cur))
+    for l in itertools.chain(iter_lines(path, start=start, end=end), ['']):
+        if l.strip() == '':
+            assert len(text_cur) == len(pos_label_cur) == len(parse_label_cur), 'Mismatched text and labels: [%s] vs. [%s] vs. [%s].' % (' '.join(text_cur), ' '.join(pos_label_cur), ' '.join(parse_label_cur))
+            if l == '' and len(text_cur) == 0:
+                # End of file without a pending sentence
+                break
+            if chunk_size is None:
+                yield text_cur, pos_label_cur, parse_label_cur
+            else:
                 text.append(text_cur)
                 pos_label.append(pos_label_cur)
                 parse_label.append(parse_label_cur)
-                text_cur = []
-                pos_label_cur = []
-                parse_label_cur = []
-            else:
-                w, p, l = l.strip().split()
-                text_cur.append(w)
-                pos_label_cur.append(p)
-                parse_label_cur.append(l)
+                if len(text) == chunk_size:
+                    yield text, pos_label, parse_label
+                    text = []
+                    pos_label = []
+                    parse_label = []
+            text_cur = []
+            pos_label_cur = []
+            parse_label_cur = []
+        else:
+            w, p, l = l.strip().split()
+            text_cur.append(w)
+            pos_label_cur.append(p)
+            parse_label_cur.append(l)
+
+    if chunk_size is not None and len(text) > 0:
+        yield text, pos_label, parse_label
+
+
+def read_parse_label_file(path):
+    text = []
+    pos_label = []
+    parse_label = []
+    for text_cur, pos_label_cur, parse_label_cur in iter_parse_label_file(path):
+        text.append(text_cur)
+        pos_label.append(pos_label_cur)
+        parse_label.append(parse_label_cur)
 
     return text, pos_label, parse_label
 
 
+def update_symbol_sets(symbol_sets=None, text=None, pos_label=None, parse_label=None):
+    if symbol_sets is None:
+        symbol_sets = {
+            'char': set(),
+            'word': collections.Counter(),
+            'pos_label': set(),
+            'parse_label': set(),
+            'parse_ancestor': set()
+        }
+    if text is not None:
+        for s in text:
+            symbol_sets['word'].update(s)
+            for w in s:
+                symbol_sets['char'].update(w)
+    if pos_label is not None:
+        for s in pos_label:
+            symbol_sets['pos_label'].update(s)
+    if parse_label is not None:
+        for s in parse_label:
+            symbol_sets['parse_label'].update(s)
+            symbol_sets['parse_ancestor'].update(l.split('_')[-1] for l in s)
+
+    return symbol_sets
+
+
+def merge_symbol_sets(symbol_sets):
+    out = update_symbol_sets()
+    for x in symbol_sets:
+        for k in out:
+            # Unions sets and sums word counts
+            out[k].update(x[k])
+
+    return out
+
+
 # TODO: For Evan
 def read_sts_file(path):
     sts_s1_text = []
@@ -184,33 +635,98 @@ def print_interlinearized(lines, max_tokens=20):
     return string
 
 
+_worker_dataset = None
+
+
+def _initialize_preprocessing_worker(symbol_lists):
+    global _worker_dataset
+    _worker_dataset = Dataset.from_symbol_lists(**symbol_lists)
+
+
+def _get_parse_label_shard_symbol_sets(args):
+    path, start, end, chunk_size = args
+    symbol_sets = update_symbol_sets()
+    for text, pos_label, parse_label in iter_parse_label_file(path, chunk_size=chunk_size, start=start, end=end):
+        symbol_sets = update_symbol_sets(symbol_sets, text=text, pos_label=pos_label, parse_label=parse_label)
+
+    return symbol_sets
+
+
+def _get_parse_label_shard_numeric_chunks(args):
+    path, start, end, chunk_size, factor_parse_labels = args
+    out = []
+    for text, pos_label, parse_label in iter_parse_label_file(path, chunk_size=chunk_size, start=start, end=end):
+        out.append(_worker_dataset.parsing_chunk_to_ragged_seqs(
+            text,
+            pos_label,
+            parse_label,
+            factor_parse_labels=factor_parse_labels
+        ))
+
+    return out
+
+
 class Dataset(object):
+    DEFAULT_CHUNK_SIZE = 4096
+    NUMERIC_CACHE_VERSION = 2
+    NUMERIC_CACHE_MANIFEST = 'manifest.json'
+    SYMBOL_LISTS = ['char_list', 'word_list', 'pos_label_list', 'parse_label_list', 'parse_ancestor_list']
+
     def __init__(
             self,
             parsing_train_path,
-            sts_train_path
+            sts_train_path,
+            chunk_size=None,
+            n_workers=1,
+            word_min_count=None
     ):
         self.files = {}
 
-        self.initialize_parsing_file(parsing_train_path, 'train')
-
-        parsing_text = self.files['train']['parsing_text_src']
-        pos_label = self.files['train']['pos_label_src']
-        parse_label = self.files['train']['parse_label_src']
+        if n_workers > 1:
+            # Build partial symbol sets for byte-range shards of the training file in parallel, then merge them
+            self.initialize_parsing_file(parsing_train_path, 'train', stream=True)
+            if chunk_size is None:
+                chunk_size = self.DEFAULT_CHUNK_SIZE
+            shards = [(parsing_train_path, start, end, chunk_size) for start, end in get_file_shards(parsing_train_path, n_workers)]
+            pool = multiprocessing.Pool(n_workers)
+            try:
+                symbol_sets = merge_symbol_sets(pool.map(_get_parse_label_shard_symbol_sets, shards))
+            finally:
+                pool.close()
+                pool.join()
+        elif chunk_size is None:
+            self.initialize_parsing_file(parsing_train_path, 'train')
+            symbol_sets = update_symbol_sets(
+                text=self.files['train']['parsing_text_src'],
+                pos_label=self.files['train']['pos_label_src'],
+                parse_label=self.files['train']['parse_label_src']
+            )
+        else:
+            # Stream the training file, keeping only its symbol sets
+            self.initialize_parsing_file(parsing_train_path, 'train', stream=True)
+            symbol_sets = None
+            for text, pos_label, parse_label in iter_parse_label_file(parsing_train_path, chunk_size=chunk_size):
+                symbol_sets = update_symbol_sets(symbol_sets, text=text, pos_label=pos_label, parse_label=parse_label)
+            if symbol_sets is None:
+                symbol_sets = update_symbol_sets()
 
         self.initialize_sts_file(sts_train_path, 'train')
         sts_s1_text = self.files['train']['sts_s1_text_src']
         sts_s2_text = self.files['train']['sts_s2_text_src']
         sts_label = self.files['train']['sts_label_src']
 
-        texts = parsing_text + sts_s1_text + sts_s2_text
+        symbol_sets = update_symbol_sets(symbol_sets, text=sts_s1_text + sts_s2_text)
+
+        self.char_list = [''] + sorted(list(symbol_sets['char']))
+        # Words rarer than word_min_count in the training data are left out of the vocabulary (mapped to 0)
+        self.word_list = [''] + sorted([w for w, c in symbol_sets['word'].items() if word_min_count is None or c >= word_min_count])
+        self.pos_label_list = sorted(list(symbol_sets['pos_label']))
+        self.parse_label_list = sorted(list(symbol_sets['parse_label']))
+        self.parse_ancestor_list = sorted(list(symbol_sets['parse_ancestor']))
 
-        self.char_list = get_char_set(texts)
-        self.word_list = get_vocabulary(texts)
-        self.pos_label_list = get_pos_label_set(pos_label)
-        self.parse_label_list = get_parse_label_set(parse_label)
-        self.parse_ancestor_list = get_parse_ancestor_set(parse_label)
+        self._initialize_symbol_maps()
 
+    def _initialize_symbol_maps(self):
         self.char_map = {c: i for i, c in enumerate(self.char_list)}
         self.word_map = {w: i for i, w in enumerate(self.word_list)}
         self.pos_label_map = {p: i for i, p in enumerate(self.pos_label_list)}
@@ -223,16 +739,120 @@ class Dataset(object):
         self.n_parse_label = len(self.parse_label_map)
         self.n_parse_ancestor = len(self.parse_ancestor_map)
 
-    def initialize_parsing_file(self, path, name):
-        text, pos_label, parse_label = read_parse_label_file(path)
+        self.symbol_tables = {
+            'char': np.array(self.char_list, dtype=object),
+            'word': np.array(self.word_list, dtype=object),
+            'pos_label': np.array(self.pos_label_list, dtype=object),
+            'parse_label': np.array(self.parse_label_list, dtype=object),
+            'parse_ancestor': np.array(self.parse_ancestor_list, dtype=object)
+        }
 
-        new = {
-            'parsing_text_src': text,
-            'pos_label_src': pos_label,
-            'parse_label_src': parse_label
+    @classmethod
+    def from_symbol_lists(cls, char_list, word_list, pos_label_list, parse_label_list, parse_ancestor_list):
+        """
+        Construct an empty dataset (no files) from existing symbol tables, e.g. for encoding new data in the
+        symbol space of a trained model.
+
+        :return: ``Dataset``; the dataset.
+        """
+        out = cls.__new__(cls)
+        out.files = {}
+        out.char_list = char_list
+        out.word_list = word_list
+        out.pos_label_list = pos_label_list
+        out.parse_label_list = parse_label_list
+        out.parse_ancestor_list = parse_ancestor_list
+        out._initialize_symbol_maps()
+
+        return out
+
+    @classmethod
+    def load_numeric_cache(cls, dir_path, mmap_mode='r'):
+        """
+        Construct a dataset from a numeric cache written by ``save_numeric_cache``. Arrays are memory-mapped, so
+        loading is nearly instantaneous and processes that load the same cache share its pages. The resulting
+        dataset contains numeric data and symbol tables only (no source strings).
+
+        :param dir_path: ``str``; path to the cache directory.
+        :param mmap_mode: ``str`` or ``None``; mode passed to ``numpy.load``. If ``None``, arrays are read into memory.
+        :return: ``Dataset``; the loaded dataset.
+        """
+        with open(os.path.join(dir_path, cls.NUMERIC_CACHE_MANIFEST), 'r') as f:
+            manifest = json.load(f)
+
+        assert manifest['version'] == cls.NUMERIC_CACHE_VERSION, 'Numeric cache at %s has version %s, expected %s.' % (dir_path, manifest['version'], cls.NUMERIC_CACHE_VERSION)
+
+        out = cls.from_symbol_lists(**manifest['symbols'])
+
+        for name in manifest['files']:
+            out.files[name] = {}
+            for k, v in manifest['files'][name].items():
+                if v is None:
+                    out.files[name][k] = None
+                else:
+                    out.files[name][k] = np.load(os.path.join(dir_path, name, k + '.npy'), mmap_mode=mmap_mode)
+
+        return out
+
+    @classmethod
+    def numeric_cache_exists(cls, dir_path):
+        return os.path.exists(os.path.join(dir_path, cls.NUMERIC_CACHE_MANIFEST))
+
+    def save_numeric_cache(self, dir_path, names=None):
+        """
+        Save the symbol tables and the cached numeric data as a directory of ``.npy`` files plus a JSON manifest,
+        for fast reloading with ``load_numeric_cache``. The cache is written to a temporary directory and moved into
+        place once complete, so concurrent readers never see a partial cache.
+
+        :param dir_path: ``str``; path to the cache directory.
+        :param names: ``list`` of ``str`` or ``None``; names of the splits to save. If ``None``, all splits with cached numeric data.
+        :return: ``None``
+        """
+        if names is None:
+            names = [x for x in self.files if 'parsing_sentence_offsets' in self.files[x]]
+
+        tmp_path = dir_path.rstrip('/\\') + '.tmp%d' % os.getpid()
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        manifest = {
+            'version': self.NUMERIC_CACHE_VERSION,
+            'symbols': {k: getattr(self, k) for k in self.SYMBOL_LISTS},
+            'files': {}
         }
 
-        self.files[name] = new
+        for name in names:
+            os.makedirs(os.path.join(tmp_path, name))
+            manifest['files'][name] = {}
+            for k, v in self.files[name].items():
+                if k.endswith('_src'):
+                    continue
+                if v is None:
+                    manifest['files'][name][k] = None
+                elif isinstance(v, np.ndarray):
+                    np.save(os.path.join(tmp_path, name, k + '.npy'), v)
+                    manifest['files'][name][k] = {'dtype': str(v.dtype), 'shape': list(v.shape)}
+
+        with open(os.path.join(tmp_path, self.NUMERIC_CACHE_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.exists(dir_path):
+            shutil.rmtree(dir_path)
+        os.rename(tmp_path, dir_path)
+
+    def initialize_parsing_file(self, path, name, stream=False):
+        new = {'parsing_path': path}
+
+        if not stream:
+            text, pos_label, parse_label = read_parse_label_file(path)
+            new['parsing_text_src'] = text
+            new['pos_label_src'] = pos_label
+            new['parse_label_src'] = parse_label
+
+        if name not in self.files:
+            self.files[name] = {}
+        self.files[name].update(new)
 
     def initialize_sts_file(self, path, name):
         sts_s1_text, sts_s2_text, sts_label = read_sts_file(path)
@@ -243,21 +863,74 @@ class Dataset(object):
             'sts_label_src': sts_label
         }
 
-        self.files[name] = new
+        if name not in self.files:
+            self.files[name] = {}
+        self.files[name].update(new)
+
+    def cache_numeric_parsing_data(self, name='train', factor_parse_labels=True, chunk_size=None, n_workers=1):
+        # Numeric data are cached in ragged form (flat values plus sentence and word offsets) and only
+        # padded when a minibatch is assembled.
+        if n_workers > 1:
+            # Encode byte-range shards of the file in parallel, then merge the shards in file order
+            path = self.files[name]['parsing_path']
+            if chunk_size is None:
+                chunk_size = self.DEFAULT_CHUNK_SIZE
+            shards = [(path, start, end, chunk_size, factor_parse_labels) for start, end in get_file_shards(path, n_workers)]
+            symbol_lists = {k: getattr(self, k) for k in self.SYMBOL_LISTS}
+            pool = multiprocessing.Pool(n_workers, initializer=_initialize_preprocessing_worker, initargs=(symbol_lists,))
+            try:
+                chunks = pool.map(_get_parse_label_shard_numeric_chunks, shards)
+            finally:
+                pool.close()
+                pool.join()
+            numeric_chunks = list(itertools.chain.from_iterable(chunks))
+            self.files[name].update(merge_ragged_parsing_chunks(numeric_chunks, factor_parse_labels=factor_parse_labels))
+            return
+
+        if chunk_size is None and 'parsing_text_src' in self.files[name]:
+            chunks = [(
+                self.files[name]['parsing_text_src'],
+                self.files[name]['pos_label_src'],
+                self.files[name]['parse_label_src']
+            )]
+        else:
+            if chunk_size is None:
+                chunk_size = self.DEFAULT_CHUNK_SIZE
+            chunks = iter_parse_label_file(self.files[name]['parsing_path'], chunk_size=chunk_size)
+
+        numeric_chunks = []
+        for text, pos_label, parse_label in chunks:
+            numeric_chunks.append(self.parsing_chunk_to_ragged_seqs(
+                text,
+                pos_label,
+                parse_label,
+                factor_parse_labels=factor_parse_labels
+            ))
+
+        self.files[name].update(merge_ragged_parsing_chunks(numeric_chunks, factor_parse_labels=factor_parse_labels))
+
+    def parsing_chunk_to_ragged_seqs(self, text, pos_label, parse_label, factor_parse_labels=True):
+        values, (sentence_lengths, word_lengths) = self.symbols_to_ragged_seqs(data_type='parsing_text', seqs=text)
+        out = {
+            'sentence_lengths': sentence_lengths,
+            'word_lengths': word_lengths.astype(get_int_dtype(word_lengths)),
+            'parsing_text': values.astype(get_int_dtype(values))
+        }
 
-    def cache_numeric_parsing_data(self, name='train', factor_parse_labels=True):
-        self.files[name]['parsing_text'], self.files[name]['parsing_text_mask'] = self.symbols_to_padded_seqs(
-            name=name,
-            data_type='parsing_text',
-            return_mask=True
-        )
-        self.files[name]['pos_label'] = self.symbols_to_padded_seqs(name=name, data_type='pos_label')
+        values, _ = self.symbols_to_ragged_seqs(data_type='parsing_text', char_tokenized=False, seqs=text)
+        out['parsing_words'] = values.astype(get_int_dtype(values))
+
+        to_cache = [('pos_label', 'pos_label', pos_label)]
         if factor_parse_labels:
-            self.files[name]['parse_depth'] = self.symbols_to_padded_seqs(name=name, data_type='parse_depth')
-            self.files[name]['parse_label'] = self.symbols_to_padded_seqs(name=name, data_type='parse_ancestor')
+            to_cache += [('parse_depth', 'parse_depth', parse_label), ('parse_label', 'parse_ancestor', parse_label)]
         else:
-            self.files[name]['parse_depth'] = None
-            self.files[name]['parse_label'] = self.symbols_to_padded_seqs(name=name, data_type='parse_label')
+            to_cache += [('parse_label', 'parse_label', parse_label)]
+
+        for key, data_type, seqs in to_cache:
+            values, _ = self.symbols_to_ragged_seqs(data_type=data_type, seqs=seqs)
+            out[key] = values.astype(get_int_dtype(values))
+
+        return out
 
     # TODO: For Evan
     def cache_numeric_sts_data(self, name='train', factor_parse_labels=True):
@@ -326,7 +999,7 @@ class Dataset(object):
     def int_to_sts_label(self, i):
         return str(i)
 
-    def symbols_to_padded_seqs(
+    def symbols_to_ragged_seqs(
             self,
             name='train',
             data_type='parsing_text',
@@ -335,7 +1008,7 @@ class Dataset(object):
             as_char=False,
             word_tokenized=True,
             char_tokenized=True,
-            return_mask=False
+            seqs=None
     ):
         data_type_tmp = data_type + '_src'
         if data_type.lower() in ['parsing_text', 'sts_s1_text', 'sts_s1_text']:
@@ -393,33 +1066,61 @@ class Dataset(object):
         else:
             raise ValueError('Unrecognized data_type "%s".' % data_type)
 
-        data = self.get_seqs(name=name, data_type=data_type_tmp, as_words=as_words)
-
-        out = []
-        if return_mask:
-            mask = []
-        for i, s in enumerate(data):
-            newline = list(map(f, s))[:max_token]
-            out.append(newline)
-            if return_mask:
-                if data_type.endswith('text') and char_tokenized and word_tokenized:
-                    mask.append([[1] * len(x) for x in newline])
-                else:
-                    mask.append([1] * len(newline))
+        if seqs is None:
+            data = self.get_seqs(name=name, data_type=data_type_tmp, as_words=as_words)
+        elif as_words:
+            data = seqs
+        else:
+            data = [' '.join(s) for s in seqs]
 
-        out = pad_sequence(out, value=0)
-        if not as_char:
-            out = out.astype('int')
-        if data_type.lower().endswith('parse_depth'):
-            final_depth = -out[..., :-1].sum(axis=-1)
-            out[..., -1] = final_depth
-        if return_mask:
-            mask = pad_sequence(mask)
+        if data_type.endswith('text') and char_tokenized and word_tokenized:
+            n_axes = 3
+        else:
+            n_axes = 2
 
-        if return_mask:
-            return out, mask
+        out = [list(map(f, s))[:max_token] for s in data]
+        values, lengths = flatten_ragged(out, rank=n_axes)
 
-        return out
+        if data_type.lower().endswith('parse_depth') and not as_char:
+            # The final depth of each sentence closes all constituents left open by the preceding words.
+            sentence_offsets = get_offsets(lengths[0])
+            nonempty = lengths[0] > 0
+            start = sentence_offsets[:-1][nonempty]
+            end = sentence_offsets[1:][nonempty] - 1
+            cumsum = get_offsets(values)
+            values[end] = -(cumsum[end] - cumsum[start])
+
+        return values, lengths
+
+    def symbols_to_padded_seqs(
+            self,
+            name='train',
+            data_type='parsing_text',
+            max_token=None,
+            max_subtoken=None,
+            as_char=False,
+            word_tokenized=True,
+            char_tokenized=True,
+            return_mask=False
+    ):
+        values, lengths = self.symbols_to_ragged_seqs(
+            name=name,
+            data_type=data_type,
+            max_token=max_token,
+            max_subtoken=max_subtoken,
+            as_char=as_char,
+            word_tokenized=word_tokenized,
+            char_tokenized=char_tokenized
+        )
+
+        if as_char:
+            dtype = object
+            value = ''
+        else:
+            dtype = 'int'
+            value = 0
+
+        return pad_ragged(values, lengths, dtype=dtype, value=value, return_mask=return_mask)
 
     def padded_seqs_to_symbols(
             self,
@@ -431,27 +1132,33 @@ class Dataset(object):
             char_tokenized=True,
             word_tokenized=True
     ):
+        join_chars = data_type.lower().endswith('text') and char_tokenized and word_tokenized
+
         if data_type.lower().endswith('text'):
             if char_tokenized:
-                f = np.vectorize(self.int_to_char, otypes=[np.str])
+                table = self.symbol_tables['char']
             else:
                 if word_tokenized:
-                    f = np.vectorize(self.int_to_word, otypes=[np.str])
+                    table = self.symbol_tables['word']
                 else:
                     raise ValueError('Text must be tokenized at the word or character level (or both).')
+            f = lambda x: table[x]
         elif data_type.lower() == 'pos_label':
-            f = np.vectorize(self.int_to_pos_label, otypes=[np.str])
+            f = lambda x: self.symbol_tables['pos_label'][x]
         elif data_type.lower() == 'parse_label':
-            f = np.vectorize(self.int_to_parse_label, otypes=[np.str])
+            f = lambda x: self.symbol_tables['parse_label'][x]
         elif data_type.lower() == 'parse_depth':
-            f = np.vectorize(self.int_to_parse_depth, otypes=[np.str])
+            f = lambda x: np.asarray(x).astype(str).astype(object)
         elif data_type.lower() == 'parse_ancestor':
-            f = np.vectorize(self.int_to_parse_ancestor, otypes=[np.str])
+            f = lambda x: self.symbol_tables['parse_ancestor'][x]
         elif data_type.lower() == 'parse_joint':
-            if depth_on_all:
-                f = np.vectorize(self.ints_to_parse_joint_depth_on_all, otypes=[np.str])
-            else:
-                f = np.vectorize(self.ints_to_parse_joint, otypes=[np.str])
+            def f(i_depth, i_ancestor):
+                depth = np.asarray(i_depth).astype(str).astype(object)
+                ancestor = self.symbol_tables['parse_ancestor'][i_ancestor]
+                joint = depth + '_' + ancestor
+                if not depth_on_all:
+                    joint = np.where(np.isin(ancestor, ['None', '-BOS-', '-EOS-']), ancestor, joint)
+                return joint
         elif data_type.lower() == 'sts_label':
             # TODO: For Evan
             pass
@@ -459,66 +1166,169 @@ class Dataset(object):
             raise ValueError('Unrecognized data_type "%s".' % data_type)
 
         if data_type.lower() == 'parse_joint':
-            data = f(*data)
+            data = f(*[np.asarray(x) for x in data])
         else:
-            data = f(data)
-        if mask is not None:
-            data = np.where(mask, data, np.zeros_like(data).astype('str'))
-        data = data.tolist()
-        out = []
-        for s in data:
-            newline = []
-            for w in s:
-                if data_type.endswith('text') and char_tokenized and word_tokenized:
-                    w = ''.join(w)
-                if w != '':
-                    newline.append(w)
-            if as_list:
-                s = newline
-            else:
-                s = ' '.join(newline)
-            out.append(s)
+            data = f(np.asarray(data))
+
+        if mask is None:
+            keep = np.ones(data.shape, dtype=bool)
+        else:
+            keep = np.asarray(mask) > 0
+
+        if join_chars:
+            # Join the characters of all words at once, then slice words out by their string lengths
+            n_sent, n_word = data.shape[:2]
+            chars = data[keep]
+            char_lengths = np.fromiter(map(len, chars), dtype='int64', count=len(chars))
+            word_ix = np.nonzero(keep)
+            word_ix = word_ix[0] * n_word + word_ix[1]
+            word_lengths = np.bincount(word_ix, weights=char_lengths, minlength=n_sent * n_word).astype('int64')
+            word_offsets = get_offsets(word_lengths)
+            joined = ''.join(chars.tolist())
+
+            nonempty = np.nonzero(word_lengths > 0)[0]
+            words = [joined[word_offsets[i]:word_offsets[i + 1]] for i in nonempty]
+            sentence_lengths = np.bincount(nonempty // n_word, minlength=n_sent)
+        else:
+            keep &= data != ''
+            words = data[keep].tolist()
+            sentence_lengths = keep.sum(axis=-1)
+
+        sentence_offsets = get_offsets(sentence_lengths)
+        out = [words[sentence_offsets[i]:sentence_offsets[i + 1]] for i in range(len(sentence_lengths))]
 
         if not as_list:
-            out = '\n'.join(out)
+            out = '\n'.join([' '.join(s) for s in out])
 
         return out
 
-    def get_parsing_data_feed(
+    def get_parsing_lengths(self, name):
+        sentence_offsets = self.files[name]['parsing_sentence_offsets'].astype('int64')
+        word_offsets = self.files[name]['parsing_word_offsets'].astype('int64')
+        n_words = np.diff(sentence_offsets)
+        word_lengths = np.diff(word_offsets)
+        max_chars = np.zeros_like(n_words)
+        nonempty = n_words > 0
+        if nonempty.any():
+            max_chars[nonempty] = np.maximum.reduceat(word_lengths, sentence_offsets[:-1][nonempty])
+
+        return n_words, max_chars
+
+    def get_parsing_batch(self, name, indices):
+        """
+        Assemble a padded minibatch from the ragged numeric cache. Each minibatch is padded only to its own
+        maximum word count and word length.
+
+        :param name: ``str``; name of the data split.
+        :param indices: ``numpy`` array; indices of the sentences in the minibatch.
+        :return: ``dict``; padded numeric arrays keyed by data type.
+        """
+        data = self.files[name]
+        sentence_offsets = data['parsing_sentence_offsets']
+        word_offsets = data['parsing_word_offsets']
+
+        n_words = sentence_offsets[indices + 1].astype('int64') - sentence_offsets[indices]
+        word_ix = ragged_range(sentence_offsets[indices], n_words)
+        n_chars = word_offsets[word_ix + 1].astype('int64') - word_offsets[word_ix]
+        char_ix = ragged_range(word_offsets[word_ix], n_chars)
+
+        parsing_text, parsing_text_mask = pad_ragged(
+            data['parsing_text'][char_ix],
+            [n_words, n_chars],
+            dtype='int',
+            return_mask=True
+        )
+
+        out = {
+            'parsing_text': parsing_text,
+            'parsing_text_mask': parsing_text_mask
+        }
+        for k in ['parsing_words', 'pos_label', 'parse_label', 'parse_depth']:
+            if data[k] is None:
+                out[k] = None
+            else:
+                out[k] = pad_ragged(data[k][word_ix], [n_words], dtype='int')
+
+        return out
+
+    def parsing_text_to_batch(self, text):
+        """
+        Encode raw tokenized sentences as a padded parsing minibatch (without labels), in the format returned by
+        ``get_parsing_batch``.
+
+        :param text: ``list`` of ``list`` of ``str``; sentences as lists of words.
+        :return: ``dict``; padded numeric arrays keyed by data type. Label entries are ``None``.
+        """
+        values, (sentence_lengths, word_lengths) = self.symbols_to_ragged_seqs(data_type='parsing_text', seqs=text)
+        parsing_text, parsing_text_mask = pad_ragged(
+            values,
+            [sentence_lengths, word_lengths],
+            dtype='int',
+            return_mask=True
+        )
+        word_ids, _ = self.symbols_to_ragged_seqs(data_type='parsing_text', char_tokenized=False, seqs=text)
+
+        return {
+            'parsing_text': parsing_text,
+            'parsing_text_mask': parsing_text_mask,
+            'parsing_words': pad_ragged(word_ids, [sentence_lengths], seq_shape=parsing_text.shape[:2], dtype='int'),
+            'pos_label': None,
+            'parse_label': None,
+            'parse_depth': None
+        }
+
+    def get_parsing_minibatch_indices(
             self,
             name,
             minibatch_size=128,
-            randomize=False
+            randomize=False,
+            bucket=False,
+            max_tokens=None
     ):
-        parsing_text = self.files[name]['parsing_text']
-        parsing_text_mask = self.files[name]['parsing_text_mask']
-        pos_label = self.files[name]['pos_label']
-        parse_label = self.files[name]['parse_label']
-        parse_depth = self.files[name]['parse_depth']
-
+        """
+        Get the sentence indices of each minibatch of a pass over a parsing dataset.
+
+        :param name: ``str``; name of the dataset.
+        :param minibatch_size: ``int`` or ``None``; maximum number of sentences per minibatch (full-batch if ``None``).
+        :param randomize: ``bool``; shuffle sentences (and, if **bucket**, minibatches).
+        :param bucket: ``bool``; group sentences of similar shape into minibatches (see ``get_length_buckets``). Without **randomize**, sentences are visited in order of length.
+        :param max_tokens: ``int`` or ``None``; if **bucket**, maximum number of padded word slots per minibatch.
+        :return: ``list`` of ``numpy`` arrays of sentence indices, one per minibatch.
+        """
         n = self.get_n(name)
+        if minibatch_size is None:
+            minibatch_size = max(n, 1)
 
-        i = 0
-
-        if randomize:
-            ix, ix_inv = get_random_permutation(n)
+        if bucket:
+            n_words, max_chars = self.get_parsing_lengths(name)
+            batches = get_length_buckets(n_words, max_chars, minibatch_size, randomize=randomize, max_tokens=max_tokens)
         else:
-            ix = np.arange(n)
-
-        while i < n:
-            indices = ix[i:i+minibatch_size]
+            if randomize:
+                ix, ix_inv = get_random_permutation(n)
+            else:
+                ix = np.arange(n)
+            batches = [ix[i:i+minibatch_size] for i in range(0, n, minibatch_size)]
 
-            out = {
-                'parsing_text': parsing_text[indices],
-                'parsing_text_mask': parsing_text_mask[indices],
-                'pos_label': pos_label[indices],
-                'parse_label': parse_label[indices],
-                'parse_depth': None if parse_depth is None else parse_depth[indices],
-            }
+        return batches
 
-            yield out
+    def get_parsing_data_feed(
+            self,
+            name,
+            minibatch_size=128,
+            randomize=False,
+            bucket=False,
+            max_tokens=None
+    ):
+        batches = self.get_parsing_minibatch_indices(
+            name,
+            minibatch_size=minibatch_size,
+            randomize=randomize,
+            bucket=bucket,
+            max_tokens=max_tokens
+        )
 
-            i += minibatch_size
+        for indices in batches:
+            yield self.get_parsing_batch(name, indices)
 
     def get_sts_data_feed(
             self,
@@ -541,12 +1351,12 @@ class Dataset(object):
         pass
 
     def get_n(self, name):
-        return len(self.files[name]['parsing_text'])
+        return len(self.files[name]['parsing_sentence_offsets']) - 1
 
     def get_n_minibatch(self, name, minibatch_size):
         return math.ceil(self.get_n(name) / minibatch_size)
 
-    def parse_predictions_to_sequences(self, numeric_chars, numeric_pos, numeric_label, numeric_depth=None, mask=None):
+    def parse_predictions_to_sequences(self, numeric_chars, numeric_pos, numeric_label, numeric_depth=None, mask=None, f=None):
         if mask is not None:
             char_mask = mask
             word_mask = mask.any(axis=-1)
@@ -561,14 +1371,16 @@ class Dataset(object):
         else:
             label = self.padded_seqs_to_symbols([numeric_depth, numeric_label], 'parse_joint', mask=word_mask, as_list=True, depth_on_all=False)
 
-        out = ''
+        if f is None:
+            out = io.StringIO()
+        else:
+            out = f
 
         for s_w, s_p, s_l in zip(words, pos, label):
-            for x in zip(s_w, s_p, s_l):
-               out += '\t'.join(x) + '\n'
-            out += '\n'
+            out.write(''.join(['\t'.join(x) + '\n' for x in zip(s_w, s_p, s_l)]) + '\n')
 
-        return out
+        if f is None:
+            return out.getvalue()
 
     def sts_predictions_to_sequences(self, *args, **kwargs):
         # TODO: For Evan
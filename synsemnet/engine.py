@@ -0,0 +1,299 @@
+import os
+import json
+import numpy as np
+
+EXPORT_METADATA = 'metadata.json'
+EXPORT_VARIABLES = 'variables.npz'
+
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+ACTIVATIONS = {
+    None: lambda x: x,
+    'linear': lambda x: x,
+    'tanh': np.tanh,
+    'sigmoid': sigmoid,
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0., 1.),
+    'relu': lambda x: np.maximum(x, 0.),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0.))),
+    'softplus': lambda x: np.logaddexp(x, 0.)
+}
+
+
+def get_activation(activation):
+    if activation not in ACTIVATIONS:
+        raise ValueError('Activation "%s" is not supported by the NumPy engine.' % activation)
+    return ACTIVATIONS[activation]
+
+
+def reverse_padded(x, lengths):
+    # Reverse the unpadded elements of 'pre'-padded sequences in place: [0, 0, a, b, c] -> [0, 0, c, b, a]
+    T = x.shape[1]
+    t = np.arange(T)[None, ...]
+    start = (T - lengths)[..., None]
+    ix = np.where(t >= start, T - 1 + start - t, t)
+    ix = ix.reshape(ix.shape + (1,) * (x.ndim - 2))
+
+    return np.take_along_axis(x, ix, axis=1)
+
+
+def lstm(
+        X,
+        mask,
+        kernel,
+        recurrent_kernel,
+        bias,
+        activation=np.tanh,
+        recurrent_activation=sigmoid,
+        return_sequences=True
+):
+    """
+    Run a Keras-style LSTM (gate order i, f, c, o) over padded sequences. As in Keras, masked timesteps carry the
+    previous state and output forward.
+
+    :param X: ``numpy`` array; inputs, shape [N, T, F].
+    :param mask: ``numpy`` array; sequence mask, shape [N, T].
+    :param kernel: ``numpy`` array; input kernel, shape [F, 4 * units].
+    :param recurrent_kernel: ``numpy`` array; recurrent kernel, shape [units, 4 * units].
+    :param bias: ``numpy`` array; bias, shape [4 * units].
+    :param activation: activation function.
+    :param recurrent_activation: recurrent (gate) activation function.
+    :param return_sequences: ``bool``; return outputs at every timestep (shape [N, T, units]) rather than the final output (shape [N, units]).
+    :return: ``numpy`` array; outputs.
+    """
+    N, T = mask.shape
+    units = recurrent_kernel.shape[0]
+
+    # Input projections for all timesteps at once; only the recurrence is sequential
+    XW = np.dot(X, kernel) + bias
+    h = np.zeros((N, units), dtype=XW.dtype)
+    c = np.zeros((N, units), dtype=XW.dtype)
+    if return_sequences:
+        out = np.zeros((N, T, units), dtype=XW.dtype)
+
+    # Timesteps before the first unmasked one leave the state at zero
+    active = np.nonzero(mask.any(axis=0))[0]
+    t0 = active[0] if len(active) > 0 else T
+    for t in range(t0, T):
+        z = XW[:, t] + np.dot(h, recurrent_kernel)
+        i, f, g, o = np.split(z, 4, axis=-1)
+        c_new = recurrent_activation(f) * c + recurrent_activation(i) * activation(g)
+        h_new = recurrent_activation(o) * activation(c_new)
+        m = mask[:, t, None] > 0
+        c = np.where(m, c_new, c)
+        h = np.where(m, h_new, h)
+        if return_sequences:
+            out[:, t] = h
+
+    if return_sequences:
+        return out
+    return h
+
+
+def batch_normalize(x, gamma, beta, moving_mean, moving_variance, epsilon=0.001):
+    return (x - moving_mean) / np.sqrt(moving_variance + epsilon) * gamma + beta
+
+
+def get_n_units(n_units, n_layers):
+    if isinstance(n_units, str):
+        out = [int(x) for x in n_units.split()]
+        if len(out) == 1:
+            out = out * n_layers
+    elif isinstance(n_units, int):
+        out = [n_units] * n_layers
+    else:
+        out = n_units
+
+    return out
+
+
+class NumpySynSemNet(object):
+    """
+    A TensorFlow-free implementation of the forward pass of a SynSemNet model, computed with vectorized NumPy from
+    the weights in a SavedModel export (see ``SynSemNet.export``). To run a model from a checkpoint, export it first
+    with ``bin/export.py``.
+
+    Supports character RNN encoders, RNN word encoders (Keras or fused, with or without length-aware alignment),
+    linear and residual projections, hybrid word embeddings, and the parsing output heads. Batch normalization uses
+    moving statistics, so outputs match those of an inference build.
+
+    :param export_dir: ``str``; path to the export directory.
+    """
+
+    def __init__(self, export_dir):
+        with open(os.path.join(export_dir, EXPORT_METADATA), 'r') as f:
+            self.metadata = json.load(f)
+        with np.load(os.path.join(export_dir, EXPORT_VARIABLES)) as f:
+            self.variables = {k: f[k] for k in f.files}
+
+        md = self.metadata
+        for key in ['char_encoder_type', 'word_encoder_type']:
+            if md.get(key, 'rnn') != 'rnn':
+                raise ValueError('The NumPy engine only supports RNN encoders (got %s "%s").' % (key, md[key]))
+
+        self.char_set = md['char_set']
+        self.word_set = md['word_set']
+        self.pos_label_set = md['pos_label_set']
+        self.parse_label_set = md['parse_label_set']
+        self.factor_parse_labels = md['factor_parse_labels']
+        self.hybrid_word_embeddings = md.get('hybrid_word_embeddings', False)
+        self.dedup_word_types = md.get('dedup_word_types', False)
+        self.bidirectional = md['bidirectional']
+        self.project_word_embeddings = md['project_word_embeddings']
+        self.resnet_n_layers_inner = md['resnet_n_layers_inner']
+        self.word_emb_dim = md['word_emb_dim']
+        self.aligned_bidirectional = md.get('length_aware_rnn', False) or md.get('rnn_impl', 'keras') == 'fused'
+        self.activation_name = md['activation']
+        self.activation = get_activation(md['activation'])
+        self.recurrent_activation = get_activation(md['recurrent_activation'])
+
+        self.n_pos = len(self.pos_label_set)
+        self.n_parse_label = len(self.parse_label_set)
+        self.syn_encoder_units = get_n_units(md['syn_n_units'], md['syn_n_layers'])
+        self.sem_encoder_units = get_n_units(md['sem_n_units'], md['sem_n_layers'])
+        self.syn_n_layers = md['syn_n_layers']
+        self.sem_n_layers = md['sem_n_layers']
+
+        float_type = md.get('float_type', 'float32')
+        self.FLOAT_NP = getattr(np, float_type)
+        for k in self.variables:
+            if np.issubdtype(self.variables[k].dtype, np.floating):
+                self.variables[k] = self.variables[k].astype(self.FLOAT_NP)
+
+    def _dense(self, X, name):
+        out = np.dot(X, self.variables[name + '/kernel'])
+        if name + '/bias' in self.variables:
+            out += self.variables[name + '/bias']
+        return out
+
+    def _projection(self, X, name):
+        if self.resnet_n_layers_inner:
+            F = X
+            for i in range(self.resnet_n_layers_inner):
+                name_cur = name + '_i%d' % i
+                F = self._dense(F, name_cur)
+                F = batch_normalize(
+                    F,
+                    self.variables[name_cur + '/gamma'],
+                    self.variables[name_cur + '/beta'],
+                    self.variables[name_cur + '/moving_mean'],
+                    self.variables[name_cur + '/moving_variance']
+                )
+                if i < self.resnet_n_layers_inner - 1:
+                    F = self.activation(F)
+            return F + X
+
+        return self._dense(X, name)
+
+    def _rnn(self, X, mask, name, return_sequences=True):
+        return lstm(
+            X,
+            mask,
+            self.variables[name + '/kernel'],
+            self.variables[name + '/recurrent_kernel'],
+            self.variables[name + '/bias'],
+            activation=self.activation,
+            recurrent_activation=self.recurrent_activation,
+            return_sequences=return_sequences
+        )
+
+    def _rnn_encoder(self, X, mask, n_layers, return_sequences=True, name='character_rnn'):
+        for l in range(n_layers):
+            f = self._rnn(X, mask, name + '_fwd_l%d' % l, return_sequences=return_sequences)
+            if self.bidirectional:
+                if self.aligned_bidirectional:
+                    lengths = np.round(mask.sum(axis=1)).astype('int64')
+                    b = self._rnn(reverse_padded(X, lengths), mask, name + '_bwd_l%d' % l, return_sequences=return_sequences)
+                    if return_sequences:
+                        b = reverse_padded(b, lengths)
+                else:
+                    # Matches the original (non-length-aware) bidirectional layer, whose backward outputs stay in reversed order
+                    b = self._rnn(X[:, ::-1], mask[:, ::-1], name + '_bwd_l%d' % l, return_sequences=return_sequences)
+                X = np.concatenate([f, b], axis=-1)
+            else:
+                X = f
+
+        if self.project_word_embeddings:
+            X = self._projection(X, name + '_projection')
+
+        return X
+
+    def _word_embeddings(self, batch, prefix):
+        chars = batch['parsing_text']
+        char_mask = batch['parsing_text_mask'].astype(self.FLOAT_NP)
+        B, W, C = chars.shape
+
+        if self.hybrid_word_embeddings:
+            word_ids = batch['parsing_words']
+            char_mask = char_mask * (word_ids == 0)[..., None]
+
+        # Encode only word slots with characters
+        word_ix = np.nonzero(char_mask.any(axis=-1))
+        X = self.variables[prefix + '_character_embedding_matrix'][chars[word_ix]]
+        emb = self._rnn_encoder(X, char_mask[word_ix], 1, return_sequences=False, name=prefix + '_character_rnn')
+        out = np.zeros((B, W, emb.shape[-1]), dtype=self.FLOAT_NP)
+        out[word_ix] = emb
+
+        if self.hybrid_word_embeddings:
+            in_vocab = (word_ids > 0)[..., None]
+            out = np.where(in_vocab, self.variables[prefix + '_word_embedding_matrix'][word_ids], out)
+
+        return out
+
+    def run(self, batch, signature='parse'):
+        """
+        Run the forward pass on a padded parsing minibatch, with outputs keyed as in the signatures of the export.
+
+        :param batch: ``dict``; padded minibatch, as returned by ``Dataset.get_parsing_batch``. Labels are not required.
+        :param signature: ``str``; ``'parse'`` (see ``predict_parses``) or ``'encode'`` (see ``encode``).
+        :return: ``dict``; map from output name to ``numpy`` array.
+        """
+        if signature == 'parse':
+            return self.predict_parses(batch)
+        if signature == 'encode':
+            return self.encode(batch)
+        raise ValueError('Unrecognized signature "%s".' % signature)
+
+    def encode(self, batch):
+        """
+        Compute syntactic and semantic word encodings for a padded parsing minibatch.
+
+        :param batch: ``dict``; padded minibatch, as returned by ``Dataset.get_parsing_batch``. Labels are not required.
+        :return: ``dict``; word encodings (``'word_encodings_syn'``, ``'word_encodings_sem'``) and word mask (``'word_mask'``).
+        """
+        word_mask = batch['parsing_text_mask'].any(axis=-1).astype(self.FLOAT_NP)
+
+        out = {'word_mask': word_mask}
+        for prefix, n_layers, key in [
+            ('syntactic', self.syn_n_layers, 'word_encodings_syn'),
+            ('semantic', self.sem_n_layers, 'word_encodings_sem')
+        ]:
+            X = self._word_embeddings(batch, prefix)
+            X = self._rnn_encoder(X, word_mask, n_layers, return_sequences=True, name=prefix + '_word_encoder')
+            out[key] = X * word_mask[..., None]
+
+        return out
+
+    def predict_parses(self, batch):
+        """
+        Predict POS tags and parse labels for a padded parsing minibatch, from both the syntactic and the semantic encoder.
+
+        :param batch: ``dict``; padded minibatch, as returned by ``Dataset.get_parsing_batch``. Labels are not required.
+        :return: ``dict``; predictions keyed as in the ``'parse'`` signature of the export.
+        """
+        encodings = self.encode(batch)
+        out = {}
+        depth_logits_syn = None
+        for encoder in ['syn', 'sem']:
+            logits = self._dense(encodings['word_encodings_%s' % encoder], 'parsing_logits_%s' % encoder)
+            out['pos_label_prediction_%s' % encoder] = logits[..., :self.n_pos].argmax(axis=-1)
+            out['parse_label_prediction_%s' % encoder] = logits[..., self.n_pos:self.n_pos + self.n_parse_label].argmax(axis=-1)
+            if self.factor_parse_labels:
+                if encoder == 'syn':
+                    depth_logits_syn = logits[..., self.n_pos + self.n_parse_label]
+                # As in the TensorFlow graph, both depth predictions are read from the syntactic depth logits
+                out['parse_depth_prediction_%s' % encoder] = np.round(depth_logits_syn).astype('int32')
+
+        return out
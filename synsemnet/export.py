@@ -0,0 +1,68 @@
+import os
+import json
+import tensorflow as tf
+
+from .data import get_parsing_inputs
+from .engine import EXPORT_METADATA
+
+
+class ExportedSynSemNet(object):
+    """
+    A SynSemNet model loaded from a SavedModel export (see ``SynSemNet.export``). The serialized graph is imported
+    directly, so loading does not unpickle or rebuild the model.
+
+    :param export_dir: ``str``; path to the export directory.
+    :param config: ``tf.ConfigProto`` or ``None``; session configuration.
+    """
+
+    def __init__(self, export_dir, config=None):
+        with open(os.path.join(export_dir, EXPORT_METADATA), 'r') as f:
+            self.metadata = json.load(f)
+
+        self.char_set = self.metadata['char_set']
+        self.word_set = self.metadata['word_set']
+        self.pos_label_set = self.metadata['pos_label_set']
+        self.parse_label_set = self.metadata['parse_label_set']
+        self.factor_parse_labels = self.metadata['factor_parse_labels']
+        self.hybrid_word_embeddings = self.metadata['hybrid_word_embeddings']
+        self.dedup_word_types = self.metadata['dedup_word_types']
+
+        self.g = tf.Graph()
+        self.sess = tf.Session(graph=self.g, config=config)
+        meta_graph_def = tf.saved_model.loader.load(self.sess, [tf.saved_model.tag_constants.SERVING], export_dir)
+
+        self.signatures = {}
+        for name, signature in meta_graph_def.signature_def.items():
+            self.signatures[name] = (
+                {k: self.g.get_tensor_by_name(v.name) for k, v in signature.inputs.items()},
+                {k: self.g.get_tensor_by_name(v.name) for k, v in signature.outputs.items()}
+            )
+
+    def run(self, batch, signature='parse'):
+        """
+        Run a signature of the export on a padded parsing minibatch.
+
+        :param batch: ``dict``; padded minibatch, as returned by ``Dataset.get_parsing_batch``. Labels are not required.
+        :param signature: ``str``; name of the signature to run, one of ``['parse', 'encode']``.
+        :return: ``dict``; map from output name to ``numpy`` array.
+        """
+        inputs, outputs = self.signatures[signature]
+        feed = get_parsing_inputs(
+            batch,
+            hybrid_word_embeddings=self.hybrid_word_embeddings,
+            dedup_word_types=self.dedup_word_types
+        )
+        fd = {inputs[k]: feed[k] for k in inputs}
+        names = sorted(outputs.keys())
+        out = self.sess.run([outputs[k] for k in names], feed_dict=fd)
+
+        return dict(zip(names, out))
+
+    def predict_parses(self, batch):
+        return self.run(batch, signature='parse')
+
+    def encode(self, batch):
+        return self.run(batch, signature='encode')
+
+    def close(self):
+        self.sess.close()
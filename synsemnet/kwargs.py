@@ -233,12 +233,36 @@ SYN_SEM_NET_KWARGS = [
         [int, None],
         "Size of minibatches to use for fitting (full-batch if ``None``)."
     ),
+    Kwarg(
+        'bucket_minibatches',
+        False,
+        bool,
+        "Whether to group training sentences into minibatches of similar word count and maximum word length, trimming each minibatch to its own dimensions rather than to those of the longest sentence in the corpus."
+    ),
+    Kwarg(
+        'prefetch_depth',
+        2,
+        int,
+        "Number of minibatches to assemble ahead of time in a background thread while the current minibatch runs. If ``0``, minibatches are assembled on the main thread."
+    ),
     Kwarg(
         'eval_minibatch_size',
         100000,
         [int, None],
         "Size of minibatches to use for prediction/evaluation (full-batch if ``None``)."
     ),
+    Kwarg(
+        'bucket_eval_minibatches',
+        True,
+        bool,
+        "Whether to sort sentences by word count (then maximum word length) before batching them for prediction/evaluation, trimming each minibatch to its own dimensions. Outputs are returned in corpus order regardless."
+    ),
+    Kwarg(
+        'eval_max_tokens',
+        16384,
+        [int, None],
+        "Maximum number of padded word slots (sentences times the word count of the longest sentence) per prediction/evaluation minibatch, if **bucket_eval_minibatches** is ``True``. If ``None``, minibatches are limited only by **eval_minibatch_size**."
+    ),
     Kwarg(
         'n_pretrain_steps',
         0,
@@ -311,6 +335,54 @@ SYN_SEM_NET_KWARGS = [
         [int, None],
         "Dimensionality of character embedding layer. If ``None`` or ``0``, no character embedding used."
     ),
+    Kwarg(
+        'char_encoder_type',
+        'rnn',
+        str,
+        "Type of character encoder used to compute word embeddings. One of ``['rnn', 'cnn']``. ``'rnn'`` runs a (bi)LSTM over the characters of each word, ``'cnn'`` runs convolutions of several widths over all characters in parallel, followed by max-pooling, highway layers, and a projection to **word_emb_dim**."
+    ),
+    Kwarg(
+        'char_cnn_filter_widths',
+        '1 2 3 4 5',
+        [str, int],
+        "Widths of the convolution filters in the CNN character encoder. Can be an ``int`` or a ``str`` with space-delimited integers. Ignored unless **char_encoder_type** is ``'cnn'``."
+    ),
+    Kwarg(
+        'char_cnn_n_filters',
+        50,
+        [str, int],
+        "Number of filters per width in the CNN character encoder. Can be an ``int``, which will be used for all widths, or a ``str`` with one space-delimited integer per filter width. Ignored unless **char_encoder_type** is ``'cnn'``."
+    ),
+    Kwarg(
+        'char_cnn_n_highway_layers',
+        1,
+        int,
+        "Number of highway layers applied to the pooled features of the CNN character encoder. Ignored unless **char_encoder_type** is ``'cnn'``."
+    ),
+    Kwarg(
+        'dedup_word_types',
+        False,
+        bool,
+        "Whether to run the character encoders once per unique word type in each minibatch and gather the resulting embeddings back to their token positions, rather than once per token slot."
+    ),
+    Kwarg(
+        'pack_words',
+        False,
+        bool,
+        "Whether to run the character encoders only on word slots that contain characters, gathering them into a packed batch and scattering the results back to their positions, rather than on every (possibly padding) word slot. Ignored for parsing inputs if **dedup_word_types** is ``True``."
+    ),
+    Kwarg(
+        'hybrid_word_embeddings',
+        False,
+        bool,
+        "Whether to look up embeddings of in-vocabulary words in learned word embedding tables, running the character encoders only on out-of-vocabulary words. The vocabulary consists of training words that occur at least **word_min_count** times. Applies to parsing inputs only."
+    ),
+    Kwarg(
+        'word_min_count',
+        5,
+        int,
+        "Minimum number of occurrences in the training data for a word to receive its own embedding. Ignored unless **hybrid_word_embeddings** is ``True``."
+    ),
     Kwarg(
         'syn_n_layers',
         2,
@@ -335,6 +407,36 @@ SYN_SEM_NET_KWARGS = [
         [int, str],
         "Number of units to use in the semantic encoder layers. Can be an ``int``, which will be used for all layers, a ``str`` with **n_layers_encoder** space-delimited integers, or one for each layer in order from bottom to top."
     ),
+    Kwarg(
+        'word_encoder_type',
+        'rnn',
+        str,
+        "Type of the syntactic and semantic word encoders (of **syn_n_layers** and **sem_n_layers** layers respectively). One of ``['rnn', 'cnn', 'attention']``. ``'rnn'`` uses stacked (bi)LSTMs, ``'cnn'`` uses residual convolutions whose dilation doubles at each layer, and ``'attention'`` uses self-attention layers over word embeddings with added sinusoidal position encodings. ``'cnn'`` and ``'attention'`` run in parallel over time."
+    ),
+    Kwarg(
+        'word_cnn_kernel_width',
+        3,
+        int,
+        "Width of the convolution filters in the word encoders. Ignored unless **word_encoder_type** is ``'cnn'``."
+    ),
+    Kwarg(
+        'word_attention_n_heads',
+        4,
+        int,
+        "Number of attention heads per layer in the word encoders. Must divide the number of units in each layer. Ignored unless **word_encoder_type** is ``'attention'``."
+    ),
+    Kwarg(
+        'rnn_impl',
+        'keras',
+        str,
+        "Implementation of the LSTM layers in the recurrent encoders. One of ``['keras', 'fused']``. ``'keras'`` uses the Keras LSTM, ``'fused'`` uses a fused block LSTM kernel that computes each layer in a single op (faster on CPU). ``'fused'`` requires **activation** ``'tanh'`` and **recurrent_activation** ``'sigmoid'``, and always runs with per-sequence lengths (see **length_aware_rnn**). Checkpoints are converted between the two at load time. The implementations compute the same function only when both run length-aware: with **length_aware_rnn** ``False``, ``'keras'`` leaves the backward outputs of bidirectional encoders in reversed order, so converting such a checkpoint to ``'fused'`` (or to length-aware ``'keras'``) changes the word encodings, and a warning is printed at load time."
+    ),
+    Kwarg(
+        'length_aware_rnn',
+        False,
+        bool,
+        "Whether to run the recurrent encoders with per-sequence lengths (trimming each minibatch to its longest sequence and skipping padded timesteps) rather than masking every padded timestep. In this mode the outputs of the backward direction of bidirectional encoders are re-aligned with their input positions."
+    ),
     Kwarg(
         'activation',
         'tanh',
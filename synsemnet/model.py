@@ -1,12 +1,15 @@
 import sys
 import os
 import time
+import json
 import pickle
 import numpy as np
 import tensorflow as tf
 
 from .kwargs import SYN_SEM_NET_KWARGS
+from .data import concatenate_padded, get_parsing_inputs, prefetch
 from .backend import *
+from .engine import EXPORT_METADATA, EXPORT_VARIABLES
 from .util import *
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
@@ -35,11 +38,12 @@ class SynSemNet(object):
                              x in _INITIALIZATION_KWARGS])
     __doc__ = _doc_header + _doc_args + _doc_kwargs
 
-    def __init__(self, char_set, pos_label_set, parse_label_set, sts_label_set, **kwargs):
+    def __init__(self, char_set, pos_label_set, parse_label_set, sts_label_set, word_set=None, **kwargs):
         for kwarg in SynSemNet._INITIALIZATION_KWARGS:
             setattr(self, kwarg.key, kwargs.pop(kwarg.key, kwarg.default_value))
 
         self.char_set = char_set
+        self.word_set = word_set
         self.pos_label_set = pos_label_set
         self.parse_label_set = parse_label_set
         self.sts_label_set = sts_label_set
@@ -48,9 +52,11 @@ class SynSemNet(object):
         self._initialize_metadata()
         self.build()
 
-    def _initialize_session(self):
+    def _initialize_session(self, config=None):
+        if config is None:
+            config = tf_config
         self.g = tf.Graph()
-        self.sess = tf.Session(graph=self.g, config=tf_config)
+        self.sess = tf.Session(graph=self.g, config=config)
 
     def _initialize_metadata(self):
         self.FLOAT_TF = getattr(tf, self.float_type)
@@ -62,6 +68,11 @@ class SynSemNet(object):
         self.regularizer_losses = []
 
         self.n_char = len(self.char_set)
+        if self.word_set is None:
+            assert not self.hybrid_word_embeddings, 'A word set is required when hybrid_word_embeddings is True.'
+            self.n_word = 0
+        else:
+            self.n_word = len(self.word_set)
         self.n_pos = len(self.pos_label_set)
         self.n_parse_label = len(self.parse_label_set)
         self.n_sts_label = len(self.sts_label_set)
@@ -84,11 +95,26 @@ class SynSemNet(object):
         else:
             self.sem_encoder_units = self.sem_n_units
 
+        assert self.char_encoder_type in ['rnn', 'cnn'], 'Unrecognized char_encoder_type "%s".' % self.char_encoder_type
+        if isinstance(self.char_cnn_filter_widths, str):
+            self.char_cnn_widths = [int(x) for x in self.char_cnn_filter_widths.split()]
+        else:
+            self.char_cnn_widths = [self.char_cnn_filter_widths]
+
+        if isinstance(self.char_cnn_n_filters, str):
+            self.char_cnn_filters = [int(x) for x in self.char_cnn_n_filters.split()]
+            if len(self.char_cnn_filters) == 1:
+                self.char_cnn_filters = [self.char_cnn_filters[0]] * len(self.char_cnn_widths)
+        else:
+            self.char_cnn_filters = [self.char_cnn_n_filters] * len(self.char_cnn_widths)
+        assert len(self.char_cnn_filters) == len(self.char_cnn_widths), 'char_cnn_n_filters must provide one value per filter width.'
+
         self.predict_mode = False
 
     def _pack_metadata(self):
         md = {}
         md['char_set'] = self.char_set
+        md['word_set'] = self.word_set
         md['pos_label_set'] = self.pos_label_set
         md['parse_label_set'] = self.parse_label_set
         for kwarg in SynSemNet._INITIALIZATION_KWARGS:
@@ -97,6 +123,7 @@ class SynSemNet(object):
 
     def _unpack_metadata(self, md):
         self.char_set = md.get('char_set')
+        self.word_set = md.get('word_set')
         self.pos_label_set = md.get('pos_label_set')
         self.parse_label_set = md.get('parse_label_set')
         for kwarg in SynSemNet._INITIALIZATION_KWARGS:
@@ -118,60 +145,130 @@ class SynSemNet(object):
     # Private model construction methods
     ############################################################
 
-    def build(self, outdir=None, restore=True, verbose=True):
+    def build(self, outdir=None, restore=True, verbose=True, inference=False):
         if outdir is None:
             if not hasattr(self, 'outdir'):
                 self.outdir = './synsemnet_model/'
+        else:
+            self.outdir = outdir
+
+        # Inference builds contain only inputs, encoders and prediction heads (no losses, optimizer,
+        # EMA shadow variables, or summary writers), and restore EMA weights directly into the model variables.
+        self.inference = inference
+        if self.inference:
+            self.predict_mode = True
 
         self._initialize_inputs()
 
         GRADIENT_FLIP_SCALE = 1.
 
         # Construct encoders
-        self.syntactic_character_rnn = self._initialize_rnn_encoder(
-            1,
-            [self.word_emb_dim],
-            bidirectional=self.bidirectional,
-            project_encodings=self.project_word_embeddings,
-            return_sequences=False,
-            name='syntactic_character_rnn'
-        )
-        self.semantic_character_rnn = self._initialize_rnn_encoder(
-            1,
-            [self.word_emb_dim],
-            bidirectional=self.bidirectional,
-            project_encodings=self.project_word_embeddings,
-            return_sequences=False,
-            name='semantic_character_rnn'
-        )
-        self.syntactic_word_encoder = self._initialize_rnn_encoder(
-            self.syn_n_layers,
-            self.syn_encoder_units,
-            bidirectional=self.bidirectional,
-            project_encodings=self.project_word_embeddings,
-            return_sequences=True,
-            name='syntactic_word_encoder'
-        )
-        self.semantic_word_encoder = self._initialize_rnn_encoder(
-            self.sem_n_layers,
-            self.sem_encoder_units,
-            bidirectional=self.bidirectional,
-            project_encodings=self.project_word_embeddings,
-            return_sequences=True,
-            name='semantic_word_encoder'
-        )
+        if self.char_encoder_type == 'cnn':
+            self.syntactic_character_rnn = self._initialize_cnn_char_encoder(
+                self.word_emb_dim,
+                name='syntactic_character_cnn'
+            )
+            self.semantic_character_rnn = self._initialize_cnn_char_encoder(
+                self.word_emb_dim,
+                name='semantic_character_cnn'
+            )
+        else:
+            self.syntactic_character_rnn = self._initialize_rnn_encoder(
+                1,
+                [self.word_emb_dim],
+                bidirectional=self.bidirectional,
+                project_encodings=self.project_word_embeddings,
+                return_sequences=False,
+                name='syntactic_character_rnn'
+            )
+            self.semantic_character_rnn = self._initialize_rnn_encoder(
+                1,
+                [self.word_emb_dim],
+                bidirectional=self.bidirectional,
+                project_encodings=self.project_word_embeddings,
+                return_sequences=False,
+                name='semantic_character_rnn'
+            )
+        if self.word_encoder_type == 'rnn':
+            self.syntactic_word_encoder = self._initialize_rnn_encoder(
+                self.syn_n_layers,
+                self.syn_encoder_units,
+                bidirectional=self.bidirectional,
+                project_encodings=self.project_word_embeddings,
+                return_sequences=True,
+                name='syntactic_word_encoder'
+            )
+            self.semantic_word_encoder = self._initialize_rnn_encoder(
+                self.sem_n_layers,
+                self.sem_encoder_units,
+                bidirectional=self.bidirectional,
+                project_encodings=self.project_word_embeddings,
+                return_sequences=True,
+                name='semantic_word_encoder'
+            )
+        else:
+            self.syntactic_word_encoder = self._initialize_parallel_encoder(
+                self.syn_n_layers,
+                self.syn_encoder_units,
+                project_encodings=self.project_word_embeddings,
+                name='syntactic_word_encoder'
+            )
+            self.semantic_word_encoder = self._initialize_parallel_encoder(
+                self.sem_n_layers,
+                self.sem_encoder_units,
+                project_encodings=self.project_word_embeddings,
+                name='semantic_word_encoder'
+            )
 
         # Construct encodings for syntactic tasks
-        self.parsing_word_embeddings_syn = self._initialize_word_embedding(
-            self.parsing_character_embeddings_syn,
-            self.syntactic_character_rnn,
-            character_mask=self.parsing_character_mask
-        )
-        self.parsing_word_embeddings_sem = self._initialize_word_embedding(
-            self.parsing_character_embeddings_sem,
-            self.semantic_character_rnn,
-            character_mask=self.parsing_character_mask
-        )
+        if self.dedup_word_types:
+            self.parsing_word_embeddings_syn = self._initialize_word_type_embedding(
+                self.parsing_word_type_character_embeddings_syn,
+                self.syntactic_character_rnn,
+                self.parsing_word_type_ix,
+                character_mask=self.parsing_word_type_character_mask
+            )
+            self.parsing_word_embeddings_sem = self._initialize_word_type_embedding(
+                self.parsing_word_type_character_embeddings_sem,
+                self.semantic_character_rnn,
+                self.parsing_word_type_ix,
+                character_mask=self.parsing_word_type_character_mask
+            )
+        elif self.hybrid_word_embeddings:
+            self.parsing_word_embeddings_syn = self._initialize_word_embedding(
+                self.parsing_character_embeddings_syn,
+                self.syntactic_character_rnn,
+                character_mask=self.parsing_oov_character_mask
+            )
+            self.parsing_word_embeddings_sem = self._initialize_word_embedding(
+                self.parsing_character_embeddings_sem,
+                self.semantic_character_rnn,
+                character_mask=self.parsing_oov_character_mask
+            )
+        else:
+            self.parsing_word_embeddings_syn = self._initialize_word_embedding(
+                self.parsing_character_embeddings_syn,
+                self.syntactic_character_rnn,
+                character_mask=self.parsing_character_mask
+            )
+            self.parsing_word_embeddings_sem = self._initialize_word_embedding(
+                self.parsing_character_embeddings_sem,
+                self.semantic_character_rnn,
+                character_mask=self.parsing_character_mask
+            )
+        if self.hybrid_word_embeddings:
+            self.parsing_word_embeddings_syn = self._initialize_hybrid_word_embedding(
+                self.parsing_word_embeddings_syn,
+                self.syntactic_word_embedding_matrix,
+                self.parsing_words,
+                self.parsing_oov_mask
+            )
+            self.parsing_word_embeddings_sem = self._initialize_hybrid_word_embedding(
+                self.parsing_word_embeddings_sem,
+                self.semantic_word_embedding_matrix,
+                self.parsing_words,
+                self.parsing_oov_mask
+            )
         self.parsing_word_encodings_syn = self._initialize_encoding(
             self.parsing_word_embeddings_syn,
             self.syntactic_word_encoder,
@@ -259,16 +356,21 @@ class SynSemNet(object):
         self._initialize_syntactic_outputs()
         self._initialize_semantic_outputs()
 
-        # Construct losses
-        with self.sess.as_default():
-            with self.sess.graph.as_default():
-                self.loss = self._initialize_syntactic_objective()
-                self.loss += self._initialize_semantic_objective()
+        if not self.inference:
+            # Construct losses
+            with self.sess.as_default():
+                with self.sess.graph.as_default():
+                    # Per-task losses, so that a batch of one task only runs the subgraph it needs
+                    self.losses = {
+                        'parsing': self._initialize_syntactic_objective(),
+                        'sts': self._initialize_semantic_objective()
+                    }
+                    self.loss = self.losses['parsing'] + self.losses['sts']
 
-        self._initialize_train_op()
-        self._initialize_ema()
-        self._initialize_saver()
-        self._initialize_logging()
+            self._initialize_train_op()
+            self._initialize_ema()
+            self._initialize_saver()
+            self._initialize_logging()
 
         with self.sess.as_default():
             with self.sess.graph.as_default():
@@ -280,7 +382,7 @@ class SynSemNet(object):
     def _initialize_inputs(self):
         with self.sess.as_default():
             with self.sess.graph.as_default():
-                self.training = tf.placeholder_with_default(tf.constant(True, dtype=tf.bool), shape=[], name='training')
+                self.training = tf.placeholder_with_default(tf.constant(not self.inference, dtype=tf.bool), shape=[], name='training')
                 self.task = tf.placeholder(self.INT_TF, shape=[None], name='task')
 
                 self.syntactic_character_embedding_matrix = tf.get_variable(
@@ -295,6 +397,20 @@ class SynSemNet(object):
                     initializer=get_initializer('he_normal_initializer', session=self.sess),
                     name='semantic_character_embedding_matrix'
                 )
+                if self.hybrid_word_embeddings:
+                    # Row 0 (out-of-vocabulary) is never used, since those words are encoded from characters
+                    self.syntactic_word_embedding_matrix = tf.get_variable(
+                        shape=[self.n_word, self.word_emb_dim],
+                        dtype=self.FLOAT_TF,
+                        initializer=get_initializer('he_normal_initializer', session=self.sess),
+                        name='syntactic_word_embedding_matrix'
+                    )
+                    self.semantic_word_embedding_matrix = tf.get_variable(
+                        shape=[self.n_word, self.word_emb_dim],
+                        dtype=self.FLOAT_TF,
+                        initializer=get_initializer('he_normal_initializer', session=self.sess),
+                        name='semantic_word_embedding_matrix'
+                    )
 
                 self._initialize_syntactic_inputs()
                 self._initialize_semantic_inputs()
@@ -323,6 +439,19 @@ class SynSemNet(object):
                 self.parsing_character_embeddings_syn = tf.gather(self.syntactic_character_embedding_matrix, self.parsing_characters)
                 self.parsing_character_embeddings_sem = tf.gather(self.semantic_character_embedding_matrix, self.parsing_characters)
 
+                if self.hybrid_word_embeddings:
+                    self.parsing_words = tf.placeholder(self.INT_TF, shape=[None, None], name='parsing_words')
+                    self.parsing_oov_mask = tf.cast(tf.equal(self.parsing_words, 0), dtype=self.FLOAT_TF) * self.parsing_word_mask
+                    # Characters of in-vocabulary words are masked out so that the character encoders skip them
+                    self.parsing_oov_character_mask = self.parsing_character_mask * self.parsing_oov_mask[..., None]
+
+                if self.dedup_word_types:
+                    self.parsing_word_type_characters = tf.placeholder(self.INT_TF, shape=[None, None], name='parsing_word_type_characters')
+                    self.parsing_word_type_character_mask = tf.placeholder(self.FLOAT_TF, shape=[None, None], name='parsing_word_type_character_mask')
+                    self.parsing_word_type_ix = tf.placeholder(self.INT_TF, shape=[None, None], name='parsing_word_type_ix')
+                    self.parsing_word_type_character_embeddings_syn = tf.gather(self.syntactic_character_embedding_matrix, self.parsing_word_type_characters)
+                    self.parsing_word_type_character_embeddings_sem = tf.gather(self.semantic_character_embedding_matrix, self.parsing_word_type_characters)
+
                 self.pos_label = tf.placeholder(self.INT_TF, shape=[None, None], name='pos_label')
 
                 self.parse_label = tf.placeholder(self.INT_TF, shape=[None, None], name='parse_label')
@@ -370,6 +499,8 @@ class SynSemNet(object):
                         activation=self.activation,
                         recurrent_activation=self.recurrent_activation,
                         return_sequences=return_sequences,
+                        length_aware=self.length_aware_rnn,
+                        rnn_impl=self.rnn_impl,
                         name=name + '_fwd_l%d' % l,
                         session=self.sess
                     )
@@ -381,42 +512,116 @@ class SynSemNet(object):
                             activation=self.activation,
                             recurrent_activation=self.recurrent_activation,
                             return_sequences=return_sequences,
+                            length_aware=self.length_aware_rnn,
+                            rnn_impl=self.rnn_impl,
                             name=name + '_bwd_l%d' % l,
                             session=self.sess
                         )
-                        char_encoder_rnn = make_bi_rnn_layer(char_encoder_fwd_rnn, char_encoder_bwd_rnn, session=self.sess)
+                        char_encoder_rnn = make_bi_rnn_layer(
+                            char_encoder_fwd_rnn,
+                            char_encoder_bwd_rnn,
+                            length_aware=self.length_aware_rnn or self.rnn_impl == 'fused',
+                            session=self.sess
+                        )
                     else:
                         char_encoder_rnn = char_encoder_fwd_rnn
                     out.append(make_lambda(char_encoder_rnn, session=self.sess, use_kwargs=True))
 
                 if project_encodings:
-                    if self.resnet_n_layers_inner:
-                        projection = DenseResidualLayer(
+                    out.append(self._initialize_encoder_projection(n_units[-1], name=name + '_projection'))
+
+                out = compose_lambdas(out)
+
+                return out
+
+    def _initialize_parallel_encoder(
+            self,
+            n_layers,
+            n_units,
+            project_encodings=True,
+            name='word_encoder'
+    ):
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                out = []
+                if self.word_encoder_type == 'attention':
+                    def add_position_encoding(x, mask=None):
+                        return x + get_position_encoding(mask, int(x.shape[-1]))
+                    out.append(add_position_encoding)
+
+                for l in range(n_layers):
+                    if self.word_encoder_type == 'cnn':
+                        layer = DilatedConvLayer(
                             training=self.training,
-                            units=n_units[-1],
-                            kernel_initializer='identity_initializer',
-                            layers_inner=self.resnet_n_layers_inner,
-                            activation_inner=self.activation,
-                            activation=None,
-                            project_inputs=False,
-                            session=self.sess,
-                            name=name + '_projection'
+                            units=n_units[l],
+                            kernel_width=self.word_cnn_kernel_width,
+                            dilation_rate=2 ** l,
+                            activation=self.activation,
+                            name=name + '_l%d' % l,
+                            session=self.sess
                         )
-                    else:
-                        projection = DenseLayer(
+                    elif self.word_encoder_type == 'attention':
+                        layer = SelfAttentionLayer(
                             training=self.training,
-                            units=n_units[-1],
-                            kernel_initializer='identity_initializer',
-                            activation=None,
-                            session=self.sess,
-                            name=name + '_projection'
+                            units=n_units[l],
+                            n_heads=self.word_attention_n_heads,
+                            name=name + '_l%d' % l,
+                            session=self.sess
                         )
-                    out.append(make_lambda(projection, session=self.sess))
+                    else:
+                        raise ValueError('Unrecognized word_encoder_type "%s".' % self.word_encoder_type)
+                    out.append(make_lambda(layer, session=self.sess, use_kwargs=True))
+
+                if project_encodings:
+                    out.append(self._initialize_encoder_projection(n_units[-1], name=name + '_projection'))
 
                 out = compose_lambdas(out)
 
                 return out
 
+    def _initialize_encoder_projection(self, n_units, name='projection'):
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                if self.resnet_n_layers_inner:
+                    projection = DenseResidualLayer(
+                        training=self.training,
+                        units=n_units,
+                        kernel_initializer='identity_initializer',
+                        layers_inner=self.resnet_n_layers_inner,
+                        activation_inner=self.activation,
+                        activation=None,
+                        project_inputs=False,
+                        session=self.sess,
+                        name=name
+                    )
+                else:
+                    projection = DenseLayer(
+                        training=self.training,
+                        units=n_units,
+                        kernel_initializer='identity_initializer',
+                        activation=None,
+                        session=self.sess,
+                        name=name
+                    )
+
+                return make_lambda(projection, session=self.sess)
+
+    def _initialize_cnn_char_encoder(self, n_units, name='character_cnn'):
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                char_encoder_cnn = CharCNNLayer(
+                    training=self.training,
+                    units=n_units,
+                    filter_widths=self.char_cnn_widths,
+                    n_filters=self.char_cnn_filters,
+                    n_highway_layers=self.char_cnn_n_highway_layers,
+                    activation=self.activation,
+                    name=name,
+                    session=self.sess
+                )
+
+                return make_lambda(char_encoder_cnn, session=self.sess, use_kwargs=True)
+
     def _initialize_word_embedding(self, inputs, encoder, character_mask=None):
         with self.sess.as_default():
             with self.sess.graph.as_default():
@@ -425,15 +630,48 @@ class SynSemNet(object):
                 C = tf.shape(inputs)[2]
                 F = inputs.shape[3]
 
-                inputs_flattened = tf.reshape(inputs, [B * W, C, F])
-                character_mask_flattened = tf.reshape(character_mask, [B * W, C])
+                if self.pack_words or self.hybrid_word_embeddings:
+                    # Encode only word slots that contain at least one character, then scatter the
+                    # embeddings back into a zero-padded [B, W, D] tensor.
+                    word_ix = tf.where(tf.reduce_any(character_mask > 0, axis=-1))
+                    inputs_packed = tf.gather_nd(inputs, word_ix)
+                    character_mask_packed = tf.gather_nd(character_mask, word_ix)
 
-                word_embedding = encoder(inputs_flattened, mask=character_mask_flattened)
+                    word_embedding = encoder(inputs_packed, mask=character_mask_packed)
 
-                word_embedding = tf.reshape(word_embedding, [B, W, self.word_emb_dim])
+                    out_shape = tf.cast(tf.stack([B, W, self.word_emb_dim]), dtype=word_ix.dtype)
+                    word_embedding = tf.scatter_nd(word_ix, word_embedding, out_shape)
+                else:
+                    inputs_flattened = tf.reshape(inputs, [B * W, C, F])
+                    character_mask_flattened = tf.reshape(character_mask, [B * W, C])
+
+                    word_embedding = encoder(inputs_flattened, mask=character_mask_flattened)
+
+                    word_embedding = tf.reshape(word_embedding, [B, W, self.word_emb_dim])
 
                 return word_embedding
 
+    def _initialize_word_type_embedding(self, inputs, encoder, type_ix, character_mask=None):
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                # Encode each word type once, then gather type embeddings back to token positions.
+                # The gradient of the gather sums over all tokens of each type.
+                word_type_embedding = encoder(inputs, mask=character_mask)
+                word_embedding = tf.gather(word_type_embedding, type_ix)
+
+                return word_embedding
+
+    def _initialize_hybrid_word_embedding(self, char_word_embedding, embedding_matrix, word_ids, oov_mask):
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                # In-vocabulary words take a row of the embedding table, out-of-vocabulary words keep
+                # their character-based embedding.
+                table_word_embedding = tf.gather(embedding_matrix, word_ids)
+                in_vocab_mask = tf.cast(word_ids > 0, dtype=self.FLOAT_TF)[..., None]
+                oov_mask = oov_mask[..., None]
+
+                return char_word_embedding * oov_mask + table_word_embedding * in_vocab_mask
+
     def _initialize_encoding(self, inputs, encoder, mask=None):
         with self.sess.as_default():
             with self.sess.graph.as_default():
@@ -626,7 +864,9 @@ class SynSemNet(object):
         with self.sess.as_default():
             with self.sess.graph.as_default():
                 self.optim = self._initialize_optimizer(self.optim_name)
-                self.train_op = self.optim.minimize(self.loss, global_step=self.global_batch_step)
+                self.train_ops = {}
+                for task in self.losses:
+                    self.train_ops[task] = self.optim.minimize(self.losses[task], global_step=self.global_batch_step)
 
     def _initialize_optimizer(self, name):
         with self.sess.as_default():
@@ -815,6 +1055,9 @@ class SynSemNet(object):
             n_minibatch=None,
             update=False,
             randomize=False,
+            bucket=False,
+            max_tokens=None,
+            task='parsing',
             return_syn_parsing_losses=False,
             return_sem_parsing_losses=False,
             return_syn_sts_losses=False,
@@ -827,22 +1070,34 @@ class SynSemNet(object):
     ):
         if minibatch_size is None:
             minibatch_size = self.minibatch_size
-        if n_minibatch is None:
-            n_minibatch = data.get_n_minibatch(data_name, minibatch_size)
+
+        batch_indices = data.get_parsing_minibatch_indices(
+            data_name,
+            minibatch_size=minibatch_size,
+            randomize=randomize,
+            bucket=bucket,
+            max_tokens=max_tokens
+        )
+        if n_minibatch is not None:
+            batch_indices = batch_indices[:n_minibatch]
+        n_minibatch = len(batch_indices)
 
         to_run = []
         to_run_names = []
 
+        # Only fetch the loss (and train op) of the task in the batch, so that TensorFlow prunes the
+        # encoders, adversarial copies and losses of the other task from the step.
         if update:
-            to_run.append(self.train_op)
+            to_run.append(self.train_ops[task])
             to_run_names.append('train_op')
 
-        to_run += [
-            self.loss
-        ]
-        to_run_names += [
-            'loss'
-        ]
+        if not self.inference:
+            to_run += [
+                self.losses[task]
+            ]
+            to_run_names += [
+                'loss'
+            ]
 
         parsing_loss_tensors, parsing_loss_tensor_names = self._get_parsing_loss_tensors(
             syn=return_syn_parsing_losses,
@@ -890,54 +1145,50 @@ class SynSemNet(object):
                 if verbose:
                     pb = tf.contrib.keras.utils.Progbar(n_minibatch)
 
-                data_feed = data.get_parsing_data_feed(
-                    data_name,
-                    minibatch_size=minibatch_size,
-                    randomize=randomize
-                )
+                data_feed = (data.get_parsing_batch(data_name, indices) for indices in batch_indices)
+                data_feed = ((batch, self._get_parsing_feed_dict(batch)) for batch in data_feed)
+                if self.prefetch_depth:
+                    data_feed = prefetch(data_feed, depth=self.prefetch_depth)
 
-                for i, batch in enumerate(data_feed):
-                    parsing_text_batch = batch['parsing_text']
-                    parsing_text_mask_batch = batch['parsing_text_mask']
-                    pos_label_batch = batch['pos_label']
-                    parse_label_batch = batch['parse_label']
-                    if self.factor_parse_labels:
-                        parse_depth_batch = batch['parse_depth']
-                    else:
-                        parse_depth_batch = None
+                input_wait_time = 0.
+                compute_time = 0.
+                n_words = 0.
+                t0 = time.time()
+
+                for i, (batch, fd_minibatch) in enumerate(data_feed):
+                    t1 = time.time()
+                    input_wait_time += t1 - t0
 
                     if 'parsing_text' in gold_keys:
-                        info_dict['parsing_text'].append(parsing_text_batch)
+                        info_dict['parsing_text'].append(batch['parsing_text'])
                     if 'parsing_text_mask' in gold_keys:
-                        info_dict['parsing_text_mask'].append(parsing_text_mask_batch)
+                        info_dict['parsing_text_mask'].append(batch['parsing_text_mask'])
                     if 'pos_label_true' in gold_keys:
-                        info_dict['pos_label_true'].append(pos_label_batch)
+                        info_dict['pos_label_true'].append(batch['pos_label'])
                     if 'parse_label_true' in gold_keys:
-                        info_dict['parse_label_true'].append(parse_label_batch)
+                        info_dict['parse_label_true'].append(batch['parse_label'])
                     if 'parse_depth_true' in gold_keys:
-                        info_dict['parse_depth_true'].append(parse_depth_batch)
-
-                    fd_minibatch = {
-                        self.parsing_characters: parsing_text_batch,
-                        self.parsing_character_mask: parsing_text_mask_batch,
-                        self.pos_label: pos_label_batch,
-                        self.parse_label: parse_label_batch
-                    }
-                    if self.factor_parse_labels:
-                        fd_minibatch[self.parse_depth] = parse_depth_batch
+                        info_dict['parse_depth_true'].append(batch['parse_depth'])
 
+                    t1 = time.time()
                     out = self.sess.run(
                         to_run,
                         feed_dict=fd_minibatch
                     )
+                    compute_time += time.time() - t1
 
                     batch_dict = {}
                     for j, x in enumerate(out):
                         batch_dict[to_run_names[j]] = x
 
+                    # Parsing losses are means over the words in the minibatch, so weighting each by its word count
+                    # gives the mean over all words, however the sentences are grouped into minibatches
+                    n_words_batch = batch['parsing_text_mask'].any(axis=-1).sum()
+                    n_words += n_words_batch
+
                     for k in info_dict:
                         if 'loss' in k:
-                            info_dict[k] += batch_dict[k]
+                            info_dict[k] += batch_dict[k] * n_words_batch
                         elif 'prediction' in k:
                             info_dict[k].append(batch_dict[k])
 
@@ -954,12 +1205,25 @@ class SynSemNet(object):
                                 ]
                         pb.update(i + 1, values=values)
 
+                    t0 = time.time()
+
+                info_dict['input_wait_time'] = input_wait_time
+                info_dict['compute_time'] = compute_time
+                if verbose:
+                    stderr('Time waiting on input: %.2fs. Time in compute: %.2fs.\n' % (input_wait_time, compute_time))
+
+                # Minibatches may visit sentences out of corpus order (shuffled or sorted by length),
+                # so outputs are put back in corpus order by sorting on the indices of the sentences visited
+                # (the inverse of the visiting order if every sentence was visited)
+                ix = np.concatenate(batch_indices) if len(batch_indices) > 0 else np.zeros(0, dtype='int64')
+                ix_inv = np.argsort(ix, kind='stable')
+
                 for k in info_dict:
                     if 'loss' in k:
-                        info_dict[k] /= n_minibatch
+                        info_dict[k] /= max(n_words, 1)
                     elif 'prediction' in k or k in gold_keys:
                         if len(info_dict[k]) > 0:
-                            info_dict[k] = np.concatenate(info_dict[k], axis=0)
+                            info_dict[k] = concatenate_padded(info_dict[k], axis=0)[ix_inv]
                         else:
                             print('Empty list:')
                             print(k)
@@ -967,6 +1231,37 @@ class SynSemNet(object):
 
                 return info_dict
 
+    def _get_parsing_input_tensors(self):
+        inputs = {
+            'parsing_characters': self.parsing_characters,
+            'parsing_character_mask': self.parsing_character_mask
+        }
+        if self.hybrid_word_embeddings:
+            inputs['parsing_words'] = self.parsing_words
+        if self.dedup_word_types:
+            inputs['parsing_word_type_characters'] = self.parsing_word_type_characters
+            inputs['parsing_word_type_character_mask'] = self.parsing_word_type_character_mask
+            inputs['parsing_word_type_ix'] = self.parsing_word_type_ix
+
+        return inputs
+
+    def _get_parsing_feed_dict(self, batch):
+        inputs = get_parsing_inputs(
+            batch,
+            hybrid_word_embeddings=self.hybrid_word_embeddings,
+            dedup_word_types=self.dedup_word_types
+        )
+        placeholders = self._get_parsing_input_tensors()
+        fd = {placeholders[k]: inputs[k] for k in inputs}
+        if batch.get('pos_label') is not None:
+            fd[self.pos_label] = batch['pos_label']
+        if batch.get('parse_label') is not None:
+            fd[self.parse_label] = batch['parse_label']
+        if self.factor_parse_labels and batch.get('parse_depth') is not None:
+            fd[self.parse_depth] = batch['parse_depth']
+
+        return fd
+
     def _get_parsing_loss_tensors(self, syn=True, sem=True):
         tensors = []
         tensor_names = []
@@ -1082,10 +1377,11 @@ class SynSemNet(object):
                         self.ema_saver.restore(self.sess, path[:-5] + '_backup.ckpt')
                     else:
                         self.saver.restore(self.sess, path[:-5] + '_backup.ckpt')
-                except tf.errors.NotFoundError as err:  # Model contains variables that are missing in checkpoint, special handling needed
+                except (tf.errors.NotFoundError, tf.errors.InvalidArgumentError) as err:  # Model contains variables that are missing in checkpoint, special handling needed
                     if allow_missing:
                         reader = tf.train.NewCheckpointReader(path)
                         saved_shapes = reader.get_variable_to_shape_map()
+                        converted_vars = self._convert_rnn_checkpoint(reader, predict=predict)
                         model_var_names = sorted(
                             [(var.name, var.name.split(':')[0]) for var in tf.global_variables()])
                         ckpt_var_names = sorted([(var.name, var.name.split(':')[0]) for var in tf.global_variables()
@@ -1094,7 +1390,7 @@ class SynSemNet(object):
                         model_var_names_set = set([x[1] for x in model_var_names])
                         ckpt_var_names_set = set([x[1] for x in ckpt_var_names])
 
-                        missing_in_ckpt = model_var_names_set - ckpt_var_names_set
+                        missing_in_ckpt = model_var_names_set - ckpt_var_names_set - converted_vars
                         if len(missing_in_ckpt) > 0:
                             sys.stderr.write(
                                 'Checkpoint file lacked the variables below. They will be left at their initializations.\n%s.\n\n' % (
@@ -1113,7 +1409,7 @@ class SynSemNet(object):
                             for var_name, saved_var_name in ckpt_var_names:
                                 curr_var = name2var[saved_var_name]
                                 var_shape = curr_var.get_shape().as_list()
-                                if var_shape == saved_shapes[saved_var_name]:
+                                if var_shape == saved_shapes[saved_var_name] and saved_var_name not in converted_vars:
                                     restore_vars.append(curr_var)
 
                         if predict:
@@ -1124,10 +1420,115 @@ class SynSemNet(object):
                         else:
                             saver_tmp = tf.train.Saver(restore_vars)
 
-                        saver_tmp.restore(self.sess, path)
+                        if len(restore_vars) > 0:
+                            saver_tmp.restore(self.sess, path)
                     else:
                         raise err
 
+    def _restore_inference(self, path):
+        # Restore into an inference build, which has no EMA shadow variables: moving averages (if saved)
+        # are loaded straight into the model variables, and training weights are used for anything else.
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                reader = tf.train.NewCheckpointReader(path)
+                saved_shapes = reader.get_variable_to_shape_map()
+                converted_vars = self._convert_rnn_checkpoint(reader, predict=bool(self.ema_decay))
+
+                var_map = {}
+                missing_in_ckpt = []
+                for var in tf.global_variables():
+                    var_name = var.op.name
+                    if var_name in converted_vars:
+                        continue
+                    ema_name = self._get_ema_name(var)
+                    if self.ema_decay and ema_name in saved_shapes:
+                        saved_var_name = ema_name
+                    else:
+                        saved_var_name = var_name
+                    if saved_shapes.get(saved_var_name) == var.get_shape().as_list():
+                        var_map[saved_var_name] = var
+                    else:
+                        missing_in_ckpt.append(var_name)
+
+                if len(missing_in_ckpt) > 0:
+                    sys.stderr.write(
+                        'Checkpoint file lacked the variables below. They will be left at their initializations.\n%s.\n\n' % (
+                            sorted(missing_in_ckpt)))
+
+                if len(var_map) > 0:
+                    tf.train.Saver(var_map).restore(self.sess, path)
+
+    def _get_ema_name(self, var):
+        # Name of the moving average of **var** in checkpoints, as assigned by ``tf.train.ExponentialMovingAverage``
+        return var.op.name + '/ExponentialMovingAverage'
+
+    def _convert_rnn_checkpoint(self, reader, predict=False):
+        # Load RNN weights saved under a different rnn_impl or length_aware_rnn setting, converting them to the
+        # layout of the current graph. Length-aware Keras cells live under the 'rnn/' scope of tf.nn.dynamic_rnn,
+        # so their variable names differ from those of the mask-based Keras layer even when the layouts match.
+        # Returns the names of the model variables that were loaded this way.
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                # Model variables are grouped by their own names and paired with the names they are saved under,
+                # since EMA names do not end in a parameter name
+                model_vars = {}
+                for v in tf.global_variables():
+                    if predict:
+                        model_vars[v.op.name] = (self._get_ema_name(v), v)
+                    else:
+                        model_vars[v.op.name] = (v.op.name, v)
+                model_layers = get_rnn_weights(model_vars)
+
+                saved_shapes = reader.get_variable_to_shape_map()
+                if predict:
+                    saved_names = [x for x in saved_shapes if x.endswith('/ExponentialMovingAverage')]
+                    saved_layers = get_rnn_weights({x[:-len('/ExponentialMovingAverage')]: x for x in saved_names})
+                else:
+                    saved_layers = get_rnn_weights({x: x for x in saved_shapes})
+
+                unmatched = sorted(set(saved_layers) - set(model_layers))
+                if len(unmatched) > 0:
+                    raise ValueError(
+                        'Checkpoint contains RNN layers with no counterpart in the current model: %s.' % unmatched)
+
+                converted = set()
+                realigned = []
+                for layer_name in model_layers:
+                    if layer_name not in saved_layers:
+                        continue
+                    model_params = model_layers[layer_name]
+                    saved_params = saved_layers[layer_name]
+                    if all([model_params[x][0] == saved_params.get(x) for x in model_params]):
+                        # Same names and layout, restored by the saver as usual
+                        continue
+
+                    model_names = {x: model_params[x][0] for x in model_params}
+                    if '_bwd_' in layer_name and \
+                            rnn_layer_is_length_aware(layer_name, model_names) != rnn_layer_is_length_aware(layer_name, saved_params):
+                        realigned.append(layer_name)
+
+                    tgt_impl = 'keras' if 'recurrent_kernel' in model_params else 'fused'
+                    weights = {x: reader.get_tensor(saved_params[x]) for x in saved_params}
+                    weights = convert_lstm_weights(weights, tgt_impl)
+                    for param_name in model_params:
+                        var = model_params[param_name][1]
+                        var.load(weights[param_name], session=self.sess)
+                        converted.add(var.name.split(':')[0])
+
+                if len(converted) > 0:
+                    sys.stderr.write('Loaded RNN weights saved under a different RNN implementation into the "%s" implementation.\n\n' % self.rnn_impl)
+                if len(realigned) > 0:
+                    sys.stderr.write(
+                        'WARNING: The layers below were saved %s length-aware alignment and are now run %s it. '
+                        'The backward outputs of bidirectional encoders are aligned differently, so word encodings '
+                        'will differ from those of the saved model. Set length_aware_rnn to match the saved model '
+                        '(rnn_impl "fused" is always length-aware) to reproduce it exactly.\n%s.\n\n' % (
+                            'without' if self.length_aware_rnn or self.rnn_impl == 'fused' else 'with',
+                            'with' if self.length_aware_rnn or self.rnn_impl == 'fused' else 'without',
+                            sorted(realigned)))
+
+                return converted
+
 
 
 
@@ -1151,6 +1552,7 @@ class SynSemNet(object):
 
     def save(self, dir=None):
 
+        assert not self.inference, 'Cannot save an inference build, since it has no training state.'
         assert not self.predict_mode, 'Cannot save while in predict mode, since this would overwrite the parameters with their moving averages.'
 
         if dir is None:
@@ -1196,12 +1598,100 @@ class SynSemNet(object):
                     self.sess.run(tf.global_variables_initializer())
                     tf.tables_initializer().run()
                 if restore and os.path.exists(outdir + '/checkpoint'):
-                    self._restore_inner(outdir + '/model.ckpt', predict=predict, allow_missing=allow_missing)
+                    if self.inference:
+                        self._restore_inference(outdir + '/model.ckpt')
+                    else:
+                        self._restore_inner(outdir + '/model.ckpt', predict=predict, allow_missing=allow_missing)
+                elif restore and self.inference:
+                    stderr('WARNING: No checkpoint found in %s. The inference build will predict with initial weights.\n' % outdir)
                 else:
                     if predict:
                         stderr('No EMA checkpoint available. Leaving internal variables unchanged.\n')
 
+    def run(self, batch, signature='parse'):
+        """
+        Run the model on a padded parsing minibatch in a single session call. Intended for prediction, so the model should be an inference build or in predict mode.
+
+        :param batch: ``dict``; padded minibatch, as returned by ``Dataset.get_parsing_batch`` or ``Dataset.parsing_text_to_batch``. Labels are not required.
+        :param signature: ``str``; ``'parse'`` for parse label predictions or ``'encode'`` for word encodings, with outputs keyed as in the signatures of ``export``.
+        :return: ``dict``; map from output name to ``numpy`` array.
+        """
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                if signature == 'parse':
+                    tensors, tensor_names = self._get_parsing_prediction_tensors(syn=True, sem=True)
+                elif signature == 'encode':
+                    tensors = [self.parsing_word_encodings_syn, self.parsing_word_encodings_sem, self.parsing_word_mask]
+                    tensor_names = ['word_encodings_syn', 'word_encodings_sem', 'word_mask']
+                else:
+                    raise ValueError('Unrecognized signature "%s".' % signature)
+
+                out = self.sess.run(tensors, feed_dict=self._get_parsing_feed_dict(batch))
+
+                return dict(zip(tensor_names, out))
+
+    def export(self, export_dir):
+        """
+        Export the model as a self-contained TensorFlow SavedModel for serving, with signatures ``'parse'``
+        (parse label predictions from the syntactic and semantic encoders) and ``'encode'`` (syntactic and semantic
+        word encodings). Both take the padded parsing inputs returned by ``data.get_parsing_inputs``. Model metadata
+        (symbol sets and settings) is written to ``metadata.json`` and the weights to ``variables.npz`` (with LSTM
+        weights in Keras layout under ``<layer name>/<parameter name>``) in the export directory. Load the export with
+        ``synsemnet.export.ExportedSynSemNet``, or without TensorFlow with ``synsemnet.engine.NumpySynSemNet``.
+
+        :param export_dir: ``str``; path to the export directory. Must not already exist.
+        :return: ``None``
+        """
+        assert self.inference, 'Only inference builds can be exported. Load the model with load_synsemnet(dir_path, inference=True).'
+
+        with self.sess.as_default():
+            with self.sess.graph.as_default():
+                inputs = self._get_parsing_input_tensors()
+                parse_tensors, parse_tensor_names = self._get_parsing_prediction_tensors(syn=True, sem=True)
+                signature_def_map = {
+                    'parse': tf.saved_model.signature_def_utils.predict_signature_def(
+                        inputs,
+                        dict(zip(parse_tensor_names, parse_tensors))
+                    ),
+                    'encode': tf.saved_model.signature_def_utils.predict_signature_def(
+                        inputs,
+                        {
+                            'word_encodings_syn': self.parsing_word_encodings_syn,
+                            'word_encodings_sem': self.parsing_word_encodings_sem,
+                            'word_mask': self.parsing_word_mask
+                        }
+                    )
+                }
+
+                builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+                builder.add_meta_graph_and_variables(
+                    self.sess,
+                    [tf.saved_model.tag_constants.SERVING],
+                    signature_def_map=signature_def_map,
+                    strip_default_attrs=True
+                )
+                builder.save()
+
+                with open(os.path.join(export_dir, EXPORT_METADATA), 'w') as f:
+                    json.dump(self._pack_metadata(), f)
+
+                model_vars = tf.global_variables()
+                values = dict(zip([v.op.name for v in model_vars], self.sess.run(model_vars)))
+                rnn_layers = get_rnn_weights({k: k for k in values})
+                for layer_name in rnn_layers:
+                    weights = {}
+                    for param_name, var_name in rnn_layers[layer_name].items():
+                        weights[param_name] = values.pop(var_name)
+                    weights = convert_lstm_weights(weights, 'keras')
+                    for param_name in weights:
+                        values[layer_name + '/' + param_name] = weights[param_name]
+                np.savez(os.path.join(export_dir, EXPORT_VARIABLES), **values)
+
     def set_predict_mode(self, mode):
+        if self.inference:
+            assert mode, 'Inference builds always predict with the moving averages of the weights (if any) and cannot leave predict mode.'
+            return
+
         with self.sess.as_default():
             with self.sess.graph.as_default():
                 if self.ema_decay:
@@ -1271,6 +1761,8 @@ class SynSemNet(object):
             run_initial_eval=False,
             verbose=True
     ):
+        assert not self.inference, 'Cannot train an inference build. Rebuild the model with inference=False.'
+
         if self.global_step.eval(session=self.sess) == 0:
             if verbose:
                 stderr('Saving initial weights...\n')
@@ -1300,6 +1792,8 @@ class SynSemNet(object):
                         minibatch_size=self.eval_minibatch_size,
                         update=False,
                         randomize=False,
+                        bucket=self.bucket_eval_minibatches,
+                        max_tokens=self.eval_max_tokens,
                         return_syn_parsing_losses=True,
                         return_sem_parsing_losses=False,
                         return_syn_parsing_predictions=False,
@@ -1315,6 +1809,8 @@ class SynSemNet(object):
                         minibatch_size=self.eval_minibatch_size,
                         update=False,
                         randomize=False,
+                        bucket=self.bucket_eval_minibatches,
+                        max_tokens=self.eval_max_tokens,
                         return_syn_parsing_losses=True,
                         return_sem_parsing_losses=False,
                         return_syn_parsing_predictions=False,
@@ -1338,6 +1834,7 @@ class SynSemNet(object):
                         minibatch_size=self.minibatch_size,
                         update=True,
                         randomize=True,
+                        bucket=self.bucket_minibatches,
                         return_syn_parsing_losses=True,
                         return_sem_parsing_losses=False,
                         return_syn_parsing_predictions=True,
@@ -1359,6 +1856,8 @@ class SynSemNet(object):
                         minibatch_size=self.eval_minibatch_size,
                         update=False,
                         randomize=False,
+                        bucket=self.bucket_eval_minibatches,
+                        max_tokens=self.eval_max_tokens,
                         return_syn_parsing_losses=True,
                         return_sem_parsing_losses=False,
                         return_syn_parsing_predictions=True,
@@ -1403,6 +1902,8 @@ class SynSemNet(object):
                     minibatch_size=self.eval_minibatch_size,
                     update=False,
                     randomize=False,
+                    bucket=self.bucket_eval_minibatches,
+                    max_tokens=self.eval_max_tokens,
                     return_syn_parsing_losses=False,
                     return_sem_parsing_losses=False,
                     return_syn_parsing_predictions=from_syn,
@@ -1425,6 +1926,8 @@ class SynSemNet(object):
             minibatch_size=self.eval_minibatch_size,
             update=False,
             randomize=False,
+            bucket=self.bucket_eval_minibatches,
+            max_tokens=self.eval_max_tokens,
             return_syn_parsing_losses=False,
             return_sem_parsing_losses=False,
             return_syn_parsing_predictions=from_syn,
@@ -0,0 +1,513 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+import collections
+from concurrent.futures import Future
+import numpy as np
+
+from .data import Dataset
+
+SIGNATURES = ['parse', 'encode']
+
+
+def get_symbol_dataset(model):
+    """
+    Construct an empty dataset with the symbol tables of a model, for encoding raw text and decoding predictions.
+
+    :param model: model exposing the symbol sets of a SynSemNet model.
+    :return: ``Dataset``; the dataset.
+    """
+    word_set = getattr(model, 'word_set', None)
+    if word_set is None:
+        word_set = ['']
+
+    return Dataset.from_symbol_lists(
+        model.char_set,
+        word_set,
+        model.pos_label_set,
+        model.parse_label_set,
+        model.parse_label_set
+    )
+
+
+def decode_parse_predictions(data, out, word_mask, factor_parse_labels=True, encoders=('syn', 'sem')):
+    """
+    Decode numeric parse predictions (as returned by the ``'parse'`` signature of a model) into symbols.
+
+    :param data: ``Dataset``; dataset with the symbol tables of the model.
+    :param out: ``dict``; numeric predictions keyed by output name.
+    :param word_mask: ``numpy`` array; word mask of the minibatch, shape [n_sentences, n_words].
+    :param factor_parse_labels: ``bool``; whether the model predicts parse labels factored into depth and ancestor.
+    :param encoders: ``tuple`` of ``str``; encoders to decode predictions from (``'syn'`` and/or ``'sem'``).
+    :return: ``dict``; map from ``'pos_<encoder>'`` and ``'parse_<encoder>'`` to ``list`` of per-sentence ``list`` of labels.
+    """
+    decoded = {}
+    for encoder in encoders:
+        decoded['pos_%s' % encoder] = data.padded_seqs_to_symbols(
+            out['pos_label_prediction_%s' % encoder],
+            'pos_label',
+            mask=word_mask
+        )
+        if factor_parse_labels:
+            decoded['parse_%s' % encoder] = data.padded_seqs_to_symbols(
+                [out['parse_depth_prediction_%s' % encoder], out['parse_label_prediction_%s' % encoder]],
+                'parse_joint',
+                mask=word_mask,
+                depth_on_all=False
+            )
+        else:
+            decoded['parse_%s' % encoder] = data.padded_seqs_to_symbols(
+                out['parse_label_prediction_%s' % encoder],
+                'parse_label',
+                mask=word_mask
+            )
+
+    return decoded
+
+
+def run_sentences(model, data, sentences, signature='parse'):
+    """
+    Run a model on raw tokenized sentences as a single minibatch and split the outputs by sentence.
+
+    :param model: model exposing ``run(batch, signature)`` and the symbol sets of a SynSemNet model.
+    :param data: ``Dataset``; dataset with the symbol tables of the model (see ``get_symbol_dataset``).
+    :param sentences: ``list`` of ``list`` of ``str``; non-empty sentences as lists of words.
+    :param signature: ``str``; ``'parse'`` or ``'encode'``.
+    :return: ``list`` of ``dict``; one entry per sentence, as returned by ``BatchingPredictor.predict``.
+    """
+    batch = data.parsing_text_to_batch(sentences)
+    out = model.run(batch, signature=signature)
+
+    results = []
+    if signature == 'parse':
+        decoded = decode_parse_predictions(
+            data,
+            out,
+            batch['parsing_text_mask'].any(axis=-1),
+            factor_parse_labels=model.factor_parse_labels
+        )
+        for i, s in enumerate(sentences):
+            result = {'words': s}
+            for k in decoded:
+                result[k] = decoded[k][i]
+            results.append(result)
+    else:
+        # Data are 'pre'-padded, so the words of each sentence are its last timesteps
+        T = out['word_encodings_syn'].shape[1]
+        for i, s in enumerate(sentences):
+            start = T - len(s)
+            results.append({
+                'word_encodings_syn': out['word_encodings_syn'][i, start:],
+                'word_encodings_sem': out['word_encodings_sem'][i, start:]
+            })
+
+    return results
+
+
+class PredictionRequest(object):
+    def __init__(self, sentences, signature):
+        self.sentences = sentences
+        self.signature = signature
+        self.max_len = max([len(s) for s in sentences]) if len(sentences) > 0 else 0
+        self.future = Future()
+        self.t_submit = time.time()
+
+
+class BatchingPredictor(object):
+    """
+    Thread-safe, low-latency prediction on raw tokenized sentences with dynamic batching. Requests submitted from any
+    number of threads are queued, and a single worker thread coalesces queued requests into minibatches that are each
+    run in one call to the model. A minibatch is run as soon as it reaches the sentence or token budget, or once its
+    oldest request has waited ``max_wait`` seconds, so batching adds at most ``max_wait`` to the latency of a request
+    under light load while amortizing per-call overhead under heavy load.
+
+    The model can be any object that exposes the symbol sets of a SynSemNet model and a ``run(batch, signature)``
+    method (``SynSemNet`` inference builds, ``ExportedSynSemNet`` or ``NumpySynSemNet``). Only the worker thread
+    calls the model, so the model itself need not be thread-safe.
+
+    :param model: model to run.
+    :param max_batch_size: ``int``; maximum number of sentences per minibatch.
+    :param max_tokens: ``int``; maximum number of padded word slots (sentences times the length of the longest sentence) per minibatch. A single request that exceeds the budget is run alone.
+    :param max_wait: ``float``; maximum time in seconds that a request waits for other requests to batch with.
+    :param max_queue_size: ``int`` or ``None``; maximum number of queued requests. Submitting to a full queue raises ``queue.Full``. If ``None``, the queue is unbounded.
+    :param latency_window: ``int``; number of most recent requests over which latency statistics are computed.
+    """
+
+    def __init__(
+            self,
+            model,
+            max_batch_size=64,
+            max_tokens=2048,
+            max_wait=0.005,
+            max_queue_size=None,
+            latency_window=10000
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+
+        self.data = get_symbol_dataset(model)
+
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.n_requests = 0
+        self.n_sentences = 0
+        self.n_batches = 0
+        self.n_rejected = 0
+
+        self.worker = threading.Thread(target=self._work, name='BatchingPredictor')
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, sentences, signature='parse'):
+        """
+        Queue sentences for prediction without waiting for the result.
+
+        :param sentences: ``list`` of ``list`` of ``str``; sentences as lists of words.
+        :param signature: ``str``; ``'parse'`` for decoded POS tags and parse labels or ``'encode'`` for word encodings.
+        :return: ``concurrent.futures.Future``; future whose result is the output of ``predict``.
+        """
+        if signature not in SIGNATURES:
+            raise ValueError('Unrecognized signature "%s".' % signature)
+
+        request = PredictionRequest(sentences, signature)
+        if len(sentences) == 0:
+            request.future.set_result([])
+            return request.future
+
+        with self.cond:
+            if self.closed:
+                raise RuntimeError('Cannot submit to a closed BatchingPredictor.')
+            if self.max_queue_size is not None and len(self.queue) >= self.max_queue_size:
+                self.n_rejected += 1
+                raise queue.Full('Prediction queue is full (%d requests).' % self.max_queue_size)
+            self.queue.append(request)
+            self.cond.notify()
+
+        return request.future
+
+    def predict(self, sentences, signature='parse', timeout=None):
+        """
+        Predict on sentences, blocking until the result is available.
+
+        :param sentences: ``list`` of ``list`` of ``str``; sentences as lists of words.
+        :param signature: ``str``; ``'parse'`` or ``'encode'``.
+        :param timeout: ``float`` or ``None``; maximum time in seconds to wait for the result.
+        :return: ``list`` of ``dict``; one entry per sentence. For ``'parse'``, the words and their POS tags and parse labels from the syntactic (``'pos_syn'``, ``'parse_syn'``) and semantic (``'pos_sem'``, ``'parse_sem'``) encoders. For ``'encode'``, the syntactic and semantic word encodings (``'word_encodings_syn'``, ``'word_encodings_sem'``), each of shape [n_words, units].
+        """
+        return self.submit(sentences, signature=signature).result(timeout=timeout)
+
+    def _get_batch_size(self):
+        # Number of queued requests (a FIFO prefix with a shared signature) that fit the budget,
+        # and whether the budget is exhausted (no further request could join the batch)
+        n_sents = 0
+        max_len = 0
+        signature = self.queue[0].signature
+        for i, request in enumerate(self.queue):
+            if request.signature != signature:
+                return i, True
+            n_sents_cur = n_sents + len(request.sentences)
+            max_len_cur = max(max_len, request.max_len)
+            if i > 0 and (n_sents_cur > self.max_batch_size or n_sents_cur * max_len_cur > self.max_tokens):
+                return i, True
+            n_sents = n_sents_cur
+            max_len = max_len_cur
+
+        return len(self.queue), n_sents >= self.max_batch_size or n_sents * max_len >= self.max_tokens
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+
+                deadline = self.queue[0].t_submit + self.max_wait
+                while True:
+                    n, full = self._get_batch_size()
+                    remaining = deadline - time.time()
+                    if full or remaining <= 0 or self.closed:
+                        break
+                    self.cond.wait(remaining)
+
+                requests = [self.queue.popleft() for _ in range(n)]
+
+            self._run(requests)
+
+    def _run(self, requests):
+        try:
+            sentences = [s for request in requests for s in request.sentences]
+            results = run_sentences(self.model, self.data, sentences, signature=requests[0].signature)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        t = time.time()
+        i = 0
+        with self.cond:
+            self.n_batches += 1
+            for request in requests:
+                self.n_requests += 1
+                self.n_sentences += len(request.sentences)
+                self.latencies.append(t - request.t_submit)
+        for request in requests:
+            n = len(request.sentences)
+            request.future.set_result(results[i:i + n])
+            i += n
+
+    def get_latency_percentiles(self, percentiles=(50, 90, 99)):
+        """
+        Get percentiles of per-request latency (time from submission to result) over recent requests.
+
+        :param percentiles: ``tuple`` of ``float``; percentiles to compute.
+        :return: ``dict``; map from percentile to latency in seconds (``None`` if no request has completed).
+        """
+        with self.cond:
+            latencies = np.array(self.latencies)
+        if len(latencies) == 0:
+            return {p: None for p in percentiles}
+
+        return dict(zip(percentiles, np.percentile(latencies, percentiles)))
+
+    def get_stats(self):
+        """
+        Get counters of served traffic.
+
+        :return: ``dict``; numbers of completed requests, sentences and batches, rejected requests and queued requests, and the mean number of sentences per batch.
+        """
+        with self.cond:
+            return {
+                'n_requests': self.n_requests,
+                'n_sentences': self.n_sentences,
+                'n_batches': self.n_batches,
+                'n_rejected': self.n_rejected,
+                'n_queued': len(self.queue),
+                'mean_batch_size': float(self.n_sentences) / self.n_batches if self.n_batches else 0.
+            }
+
+    def close(self):
+        """
+        Stop accepting requests, finish queued ones and stop the worker thread.
+
+        :return: ``None``
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.worker.join()
+
+
+BACKENDS = ['auto', 'model', 'export', 'numpy']
+
+
+def load_predictor_model(path, backend='auto', intra_op_threads=None, inter_op_threads=None):
+    """
+    Load a SynSemNet model for prediction, from either a trained model directory or an export directory
+    (see ``SynSemNet.export``). TensorFlow is only imported by the backends that need it.
+
+    :param path: ``str``; path to the model or export directory.
+    :param backend: ``str``; ``'model'`` (inference build from a model directory), ``'export'`` (SavedModel graph), ``'numpy'`` (TensorFlow-free engine on an export) or ``'auto'`` (``'export'`` if ``path`` is an export, else ``'model'``).
+    :param intra_op_threads: ``int`` or ``None``; number of threads TensorFlow uses within an op. If ``None``, TensorFlow's default. Ignored by the NumPy engine, whose BLAS thread count is fixed by the environment (e.g. ``OMP_NUM_THREADS``) when NumPy is imported.
+    :param inter_op_threads: ``int`` or ``None``; number of threads TensorFlow uses to run independent ops. If ``None``, TensorFlow's default. Ignored by the NumPy engine.
+    :return: model exposing ``run(batch, signature)`` and the model's symbol sets.
+    """
+    if backend == 'auto':
+        from .engine import EXPORT_METADATA
+        if os.path.exists(os.path.join(path, EXPORT_METADATA)):
+            backend = 'export'
+        else:
+            backend = 'model'
+
+    if backend == 'numpy':
+        from .engine import NumpySynSemNet
+        return NumpySynSemNet(path)
+
+    if backend not in ['model', 'export']:
+        raise ValueError('Unrecognized backend "%s".' % backend)
+
+    import tensorflow as tf
+    config = tf.ConfigProto()
+    if backend == 'model':
+        # As in the default session configuration of SynSemNet
+        config.gpu_options.allow_growth = True
+    if intra_op_threads is not None:
+        config.intra_op_parallelism_threads = intra_op_threads
+    if inter_op_threads is not None:
+        config.inter_op_parallelism_threads = inter_op_threads
+
+    if backend == 'model':
+        from .util import load_synsemnet
+        return load_synsemnet(path, inference=True, config=config)
+
+    from .export import ExportedSynSemNet
+    return ExportedSynSemNet(path, config=config)
+
+
+def _run_inference_worker(model, load_args, tasks, results):
+    # Failures are reported on the result queue (with minibatch ID None if the worker cannot run at all),
+    # so that the parent raises instead of waiting for results that will never come
+    try:
+        if model is None:
+            model = load_predictor_model(*load_args)
+        data = get_symbol_dataset(model)
+    except Exception as e:
+        results.put((None, None, 'Failed to load the model. %s: %s' % (type(e).__name__, e)))
+        return
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        i, sentences, signature = task
+        try:
+            results.put((i, run_sentences(model, data, sentences, signature=signature), None))
+        except Exception as e:
+            results.put((i, None, '%s: %s' % (type(e).__name__, e)))
+
+
+class InferencePool(object):
+    """
+    Pool of forked worker processes that run a SynSemNet model on minibatches of raw tokenized sentences drawn from a
+    shared queue, to use all cores on machines where one session parallelizes small minibatches poorly.
+
+    With the NumPy engine, the model is loaded once in the parent process before forking, so all workers share the
+    pages of its weights copy-on-write. TensorFlow sessions do not survive forking, so with TensorFlow backends each
+    worker loads the model itself after the fork, with its own intra- and inter-op thread counts.
+
+    :param path: ``str``; path to the model or export directory.
+    :param backend: ``str``; backend to run the model with (see ``load_predictor_model``).
+    :param n_workers: ``int`` or ``None``; number of worker processes. If ``None``, the number of CPUs.
+    :param intra_op_threads: ``int`` or ``None``; TensorFlow intra-op threads per worker.
+    :param inter_op_threads: ``int`` or ``None``; TensorFlow inter-op threads per worker.
+    :param minibatch_size: ``int``; maximum number of sentences per minibatch in ``predict``.
+    :param max_pending: ``int`` or ``None``; maximum number of minibatches queued or running at once. If ``None``, twice the number of workers.
+    """
+
+    def __init__(
+            self,
+            path,
+            backend='numpy',
+            n_workers=None,
+            intra_op_threads=1,
+            inter_op_threads=1,
+            minibatch_size=128,
+            max_pending=None
+    ):
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        if max_pending is None:
+            max_pending = 2 * n_workers
+        self.n_workers = n_workers
+        self.minibatch_size = minibatch_size
+        self.max_pending = max_pending
+        # Minibatch IDs are unique across calls to map, so results left over from an interrupted call can be discarded
+        self.n_tasks = 0
+        # Interval in seconds at which to check that the workers are alive while waiting for results
+        self.poll_interval = 1.
+
+        if backend == 'numpy':
+            model = load_predictor_model(path, backend=backend)
+        else:
+            model = None
+        load_args = (path, backend, intra_op_threads, inter_op_threads)
+
+        ctx = multiprocessing.get_context('fork')
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.workers = []
+        for _ in range(n_workers):
+            worker = ctx.Process(target=_run_inference_worker, args=(model, load_args, self.tasks, self.results))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def map(self, batches, signature='parse'):
+        """
+        Run minibatches of sentences through the workers, yielding their results in input order. At most
+        ``max_pending`` minibatches are in flight, so **batches** can be a generator over an arbitrarily large input.
+
+        :param batches: iterable of ``list`` of ``list`` of ``str``; minibatches of non-empty sentences.
+        :param signature: ``str``; ``'parse'`` or ``'encode'``.
+        :return: generator of ``list`` of ``dict``; results of each minibatch, as returned by ``BatchingPredictor.predict``.
+        """
+        start = self.n_tasks
+        n_submitted = 0
+        n_yielded = 0
+        done = {}
+        batches = iter(batches)
+        exhausted = False
+        while not exhausted or n_yielded < n_submitted:
+            while not exhausted and n_submitted - n_yielded < self.max_pending:
+                try:
+                    batch = next(batches)
+                except StopIteration:
+                    exhausted = True
+                    break
+                self.tasks.put((start + n_submitted, batch, signature))
+                n_submitted += 1
+                self.n_tasks += 1
+
+            # Buffer results that arrive early until every earlier minibatch is done
+            while n_yielded < n_submitted and n_yielded not in done:
+                i, result, error = self._get_result()
+                if i is not None and i < start:
+                    continue
+                if error is not None:
+                    raise RuntimeError('Inference worker failed: %s' % error)
+                done[i - start] = result
+            if n_yielded in done:
+                yield done.pop(n_yielded)
+                n_yielded += 1
+
+    def _get_result(self):
+        while True:
+            try:
+                return self.results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                # Workers only exit when closed, so an exited worker has died (e.g. killed for running out of memory)
+                # and any minibatch it held is lost
+                for worker in self.workers:
+                    if not worker.is_alive():
+                        raise RuntimeError('Inference worker %d exited unexpectedly with code %s.' % (worker.pid, worker.exitcode))
+
+    def predict(self, sentences, signature='parse'):
+        """
+        Predict on sentences, split into minibatches that are distributed across the workers.
+
+        :param sentences: ``list`` of ``list`` of ``str``; sentences as lists of words.
+        :param signature: ``str``; ``'parse'`` or ``'encode'``.
+        :return: ``list`` of ``dict``; one entry per sentence in input order, as returned by ``BatchingPredictor.predict``. Empty sentences get ``None``.
+        """
+        ix = [i for i, s in enumerate(sentences) if len(s) > 0]
+        batches = [ix[i:i + self.minibatch_size] for i in range(0, len(ix), self.minibatch_size)]
+
+        out = [None] * len(sentences)
+        results = self.map(([sentences[i] for i in b] for b in batches), signature=signature)
+        for b, result in zip(batches, results):
+            for i, r in zip(b, result):
+                out[i] = r
+
+        return out
+
+    def close(self):
+        """
+        Stop the workers.
+
+        :return: ``None``
+        """
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=self.poll_interval)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
@@ -12,18 +12,25 @@ def pretty_print_seconds(s):
     s = s % 3600 % 60
     return '%02d:%02d:%02d' % (h, m, s)
 
-def load_synsemnet(dir_path):
+def load_synsemnet(dir_path, inference=False, config=None):
     """
     Convenience method for reconstructing a saved SynSemNet object. First loads in metadata from ``m.obj``, then uses
     that metadata to construct the computation graph. Then, if saved weights are found, these are loaded into the
     graph.
 
     :param dir_path: Path to directory containing the DTSR checkpoint files.
+    :param inference: ``bool``; build an inference-only graph (no optimizer, EMA or summary ops) and load the moving averages of the weights into it.
+    :param config: ``tf.ConfigProto`` or ``None``; configuration of the model's session. If ``None``, the default configuration.
     :return: The loaded SynSemNet instance.
     """
 
     with open(dir_path + '/m.obj', 'rb') as f:
         m = pickle.load(f)
-    m.build(outdir=dir_path)
-    m.load(outdir=dir_path)
+    if config is not None:
+        # Unpickling starts a session with the default configuration, so replace it before building the graph
+        m.sess.close()
+        m._initialize_session(config=config)
+    m.build(outdir=dir_path, inference=inference)
+    if not inference:
+        m.load(outdir=dir_path)
     return m
\ No newline at end of file